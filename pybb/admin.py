@@ -4,7 +4,7 @@ from django.contrib import admin
 from django.core.urlresolvers import reverse
 
 from pybb.models import Category, Forum, Topic, Post, Profile, Attachment, \
-                        ReadTracking
+                        ReadTracking, Notification, Digest
 
 
 class CategoryAdmin(admin.ModelAdmin):
@@ -90,7 +90,7 @@ class ProfileAdmin(admin.ModelAdmin):
          ),
         (_('Additional options'), {
                 'classes': ('collapse',),
-                'fields' : ('signature', 'show_signatures')
+                'fields' : ('signature', 'show_signatures', 'notification_mode')
                 }
          ),
         (_('Ban options'), {
@@ -136,6 +136,23 @@ class ReadTrackingAdmin(admin.ModelAdmin):
     date_hierarchy = 'last_read'
 
 
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ['user', 'post', 'created', 'attempts', 'next_attempt']
+    search_fields = ['user__username', 'user__email']
+    raw_id_fields = ['user', 'post']
+    list_per_page = 20
+    ordering = ['-created']
+    date_hierarchy = 'created'
+
+
+class DigestAdmin(admin.ModelAdmin):
+    list_display = ['user', 'due']
+    search_fields = ['user__username', 'user__email']
+    raw_id_fields = ['user']
+    list_per_page = 20
+    ordering = ['due']
+
+
 admin.site.register(Category, CategoryAdmin)
 admin.site.register(Forum, ForumAdmin)
 admin.site.register(Topic, TopicAdmin)
@@ -143,3 +160,5 @@ admin.site.register(Post, PostAdmin)
 admin.site.register(Profile, ProfileAdmin)
 admin.site.register(Attachment, AttachmentAdmin)
 admin.site.register(ReadTracking, ReadTrackingAdmin)
+admin.site.register(Notification, NotificationAdmin)
+admin.site.register(Digest, DigestAdmin)
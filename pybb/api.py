@@ -0,0 +1,227 @@
+"""
+Read-only JSON API.
+
+Query string arguments:
+    fields: comma separated names of fields which should be returned,
+        only these fields are loaded from the database
+    limit: number of objects per page
+    after: cursor of the last object on the previous page
+
+Response is an object with ``objects`` list and ``next`` cursor which
+should be passed in ``after`` argument to get the next page. ``next`` is
+null on the last page.
+"""
+from datetime import datetime
+
+from django.conf import settings
+
+from common.http import HttpResponseJson
+
+from pybb.models import Category, Forum, Topic, Post
+from pybb.pagination import encode_cursor, decode_cursor, keyset_filter
+from pybb.conditional import conditional, index_state, forum_state, \
+                             topic_state
+
+
+class Resource(object):
+    """
+    Description of objects returned by the API.
+
+    Attributes:
+        fields: mapping of field name to the lookup of the model field,
+            lookups which span relations are loaded with ``select_related``
+        default_fields: fields returned if ``fields`` argument is not given
+        ordering: list of field names as for ``order_by``, the last field
+            must be unique
+    """
+
+    fields = {}
+    default_fields = ()
+    ordering = ()
+
+    def __init__(self, qs):
+        self.qs = qs
+
+
+class CategoryResource(Resource):
+    fields = {'id': 'id', 'name': 'name', 'position': 'position',
+              'slug': 'slug'}
+    default_fields = ('id', 'name')
+    ordering = ['position', 'id']
+
+
+class ForumResource(Resource):
+    fields = {'id': 'id', 'category': 'category', 'name': 'name',
+              'position': 'position', 'description': 'description',
+              'updated': 'updated', 'post_count': 'post_count',
+              'topic_count': 'topic_count', 'last_post': 'last_post',
+              'slug': 'slug'}
+    default_fields = ('id', 'category', 'name', 'updated', 'post_count',
+                      'topic_count')
+    ordering = ['position', 'id']
+
+
+class TopicResource(Resource):
+    fields = {'id': 'id', 'forum': 'forum', 'name': 'name',
+              'created': 'created', 'updated': 'updated', 'user': 'user',
+              'username': 'user__username', 'views': 'views',
+              'sticky': 'sticky', 'closed': 'closed',
+              'post_count': 'post_count', 'last_post': 'last_post'}
+    default_fields = ('id', 'name', 'updated', 'username', 'sticky',
+                      'closed', 'post_count')
+    ordering = ['-sticky', '-updated', '-id']
+
+
+class PostResource(Resource):
+    fields = {'id': 'id', 'topic': 'topic', 'user': 'user',
+              'username': 'user__username', 'created': 'created',
+              'updated': 'updated', 'markup': 'markup', 'body': 'body',
+              'body_html': 'body_html', 'body_text': 'body_text',
+              'position': 'position'}
+    default_fields = ('id', 'username', 'created', 'body_html')
+    ordering = ['position', 'id']
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super(ApiError, self).__init__(message)
+        self.status = status
+
+
+def get_value(obj, lookup):
+    """
+    Return value of the field defined with the lookup.
+
+    Foreign keys are returned as primary keys of related objects.
+    """
+
+    parts = lookup.split('__')
+    for part in parts[:-1]:
+        obj = getattr(obj, part)
+        if obj is None:
+            return None
+    field = obj._meta.get_field(parts[-1])
+    value = getattr(obj, field.attname)
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    return value
+
+
+def get_fields(resource, request):
+    if 'fields' in request.GET:
+        names = [x.strip() for x in request.GET['fields'].split(',')]
+        names = [x for x in names if x]
+        unknown = [x for x in names if x not in resource.fields]
+        if unknown:
+            raise ApiError('Unknown fields: %s' % ', '.join(unknown))
+        return names
+    return list(resource.default_fields)
+
+
+def get_limit(request):
+    try:
+        limit = int(request.GET.get('limit', settings.PYBB_API_PAGE_SIZE))
+    except ValueError:
+        raise ApiError('Invalid limit')
+    return max(1, min(limit, settings.PYBB_API_MAX_PAGE_SIZE))
+
+
+def project(qs, lookups):
+    """
+    Load only fields required for given lookups.
+    """
+
+    related = set()
+    for lookup in lookups:
+        parts = lookup.split('__')
+        for index in xrange(1, len(parts)):
+            related.add('__'.join(parts[:index]))
+    if related:
+        qs = qs.select_related(*related)
+    return qs.only(*lookups)
+
+
+def api_page(resource, request):
+    """
+    Return dict with the page of objects of the resource.
+    """
+
+    names = get_fields(resource, request)
+    limit = get_limit(request)
+    keys = [(x.lstrip('-'), x.startswith('-')) for x in resource.ordering]
+    key_fields = [resource.qs.model._meta.get_field(x[0]) for x in keys]
+
+    lookups = set(resource.fields[x] for x in names)
+    lookups.update(x.name for x in key_fields)
+    qs = project(resource.qs, list(lookups))
+
+    if request.GET.get('after'):
+        try:
+            values = decode_cursor(request.GET['after'], key_fields)
+        except ValueError:
+            raise ApiError('Invalid cursor')
+        qs = qs.filter(keyset_filter(keys, values, True))
+
+    objects = list(qs.order_by(*resource.ordering)[:limit + 1])
+    if len(objects) > limit:
+        objects = objects[:limit]
+        next_cursor = encode_cursor(objects[-1], key_fields)
+    else:
+        next_cursor = None
+
+    return {'objects': [dict((x, get_value(obj, resource.fields[x]))
+                             for x in names) for obj in objects],
+            'next': next_cursor,
+            }
+
+
+def api_view(func):
+    """
+    Convert the resource returned by the view into JSON response.
+    """
+
+    def wrapper(request, *args, **kwargs):
+        try:
+            data = api_page(func(request, *args, **kwargs), request)
+            status = 200
+        except ApiError, ex:
+            data = {'error': unicode(ex)}
+            status = ex.status
+        response = HttpResponseJson(data)
+        response.status_code = status
+        return response
+    return wrapper
+
+
+@conditional(index_state, per_user=False)
+@api_view
+def category_list(request):
+    return CategoryResource(Category.objects.all())
+
+
+@conditional(index_state, per_user=False)
+@api_view
+def forum_list(request):
+    qs = Forum.objects.all()
+    if 'category' in request.GET:
+        try:
+            qs = qs.filter(category=int(request.GET['category']))
+        except ValueError:
+            raise ApiError('Invalid category')
+    return ForumResource(qs)
+
+
+@conditional(forum_state, per_user=False)
+@api_view
+def topic_list(request, forum_id):
+    if not Forum.objects.filter(pk=forum_id).exists():
+        raise ApiError('Forum not found', 404)
+    return TopicResource(Topic.objects.filter(forum=forum_id))
+
+
+@conditional(topic_state, per_user=False)
+@api_view
+def post_list(request, topic_id):
+    if not Topic.objects.filter(pk=topic_id).exists():
+        raise ApiError('Topic not found', 404)
+    return PostResource(Post.objects.filter(topic=topic_id))
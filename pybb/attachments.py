@@ -0,0 +1,263 @@
+"""
+Storage and delivery of attachments.
+
+Uploaded files are stored under SHA1 digest of their content, so the same
+file attached to many posts is stored once. ``Attachment.path`` of such
+attachments is the same; the file is deleted with the last attachment which
+refers to it. ``pybb_gc_attachments`` command deletes files which are not
+referenced by any attachment, e.g. left after failed uploads or concurrent
+deletions.
+
+``PYBB_ATTACHMENT_DELIVERY`` is a dotted path of the function which accepts
+the request and the attachment and returns the response. Available
+functions:
+
+    serve_python: stream the file from the worker process in chunks,
+        supports conditional and range requests
+    serve_sendfile: delegate sending of the file to the web server with
+        X-Sendfile header (Apache mod_xsendfile, lighttpd)
+    serve_accel_redirect: delegate sending of the file to nginx with
+        X-Accel-Redirect header, the internal location is configured with
+        ``PYBB_ATTACHMENT_ACCEL_PREFIX``
+"""
+import os
+import re
+import tempfile
+from hashlib import sha1
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date, parse_http_date_safe, parse_etags
+from django.utils.importlib import import_module
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def get_storage_dir():
+    return os.path.join(settings.MEDIA_ROOT, settings.PYBB_ATTACHMENT_UPLOAD_TO)
+
+
+def digest_path(digest):
+    """
+    Return path of the file relative to the storage directory.
+    """
+
+    return os.path.join(digest[:2], digest)
+
+
+def store_file(upload):
+    """
+    Save the uploaded file under digest of its content.
+
+    The file is written and hashed chunk by chunk, so memory usage
+    does not depend on the size of the file. Return path of the file
+    relative to the storage directory.
+    """
+
+    storage_dir = get_storage_dir()
+    if not os.path.exists(storage_dir):
+        os.makedirs(storage_dir)
+
+    # temporary file is created in the same directory so it could be renamed
+    fd, temp_path = tempfile.mkstemp(dir=storage_dir, prefix='.upload')
+    digest = sha1()
+    try:
+        fobj = os.fdopen(fd, 'wb')
+        try:
+            for chunk in upload.chunks(settings.PYBB_ATTACHMENT_CHUNK_SIZE):
+                digest.update(chunk)
+                fobj.write(chunk)
+        finally:
+            fobj.close()
+
+        path = digest_path(digest.hexdigest())
+        full_path = os.path.join(storage_dir, path)
+        try:
+            # the fresh modification time protects the existing file
+            # from pybb_gc_attachments until the attachment is saved
+            os.utime(full_path, None)
+        except OSError:
+            if not os.path.exists(os.path.dirname(full_path)):
+                os.makedirs(os.path.dirname(full_path))
+            os.rename(temp_path, full_path)
+        else:
+            os.remove(temp_path)
+    except:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return path
+
+
+def attach_file(attachment, upload):
+    """
+    Store the uploaded file and save the attachment.
+
+    The existing file could be deleted by ``release_file`` of the concurrent
+    deletion before the attachment is saved, then it is stored again.
+    """
+
+    attachment.path = store_file(upload)
+    attachment.save()
+    if not os.path.exists(attachment.get_absolute_path()):
+        store_file(upload)
+
+
+def release_file(path):
+    """
+    Delete the file if no attachment refers to it.
+    """
+
+    from pybb.models import Attachment
+
+    if not Attachment.objects.filter(path=path).exists():
+        full_path = os.path.join(get_storage_dir(), path)
+        if os.path.exists(full_path):
+            os.remove(full_path)
+
+
+def get_delivery():
+    module, name = settings.PYBB_ATTACHMENT_DELIVERY.rsplit('.', 1)
+    return getattr(import_module(module), name)
+
+
+def serve(request, attachment):
+    return get_delivery()(request, attachment)
+
+
+def set_validators(response, attachment, mtime):
+    response['ETag'] = '"%s"' % attachment.hash
+    response['Last-Modified'] = http_date(mtime)
+    response['Accept-Ranges'] = 'bytes'
+
+
+def not_modified(request, attachment, mtime):
+    """
+    Check if the copy of the client is valid.
+    """
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        try:
+            etags = parse_etags(if_none_match)
+        except ValueError:
+            return False
+        return attachment.hash in etags or '*' in etags
+    if_modified_since = request.META.get('HTTP_IF_MODIFIED_SINCE')
+    if if_modified_since:
+        if_modified_since = parse_http_date_safe(if_modified_since)
+        return if_modified_since is not None and int(mtime) <= if_modified_since
+    return False
+
+
+def parse_range(request, attachment, mtime, size):
+    """
+    Return (start, stop) of requested range of bytes, None if the whole
+    file should be sent or False if the range can not be satisfied.
+
+    Only single ranges are supported, requests of multiple ranges are
+    answered with the whole file.
+    """
+
+    header = request.META.get('HTTP_RANGE')
+    if not header:
+        return None
+
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range:
+        if if_range.startswith('"') or if_range.startswith('W/'):
+            if if_range.strip('"') != attachment.hash:
+                return None
+        elif parse_http_date_safe(if_range) != int(mtime):
+            return None
+
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    start, stop = match.groups()
+    if not start and not stop:
+        return None
+    if not start:
+        # suffix range: the last N bytes
+        length = int(stop)
+        if not length:
+            return False
+        return max(0, size - length), size
+    start = int(start)
+    if start >= size:
+        return False
+    if stop:
+        stop = min(int(stop) + 1, size)
+        if stop <= start:
+            return None
+    else:
+        stop = size
+    return start, stop
+
+
+def read_chunks(path, start, stop):
+    """
+    Read bytes [start, stop) of the file in chunks.
+    """
+
+    fobj = open(path, 'rb')
+    try:
+        fobj.seek(start)
+        left = stop - start
+        while left > 0:
+            chunk = fobj.read(min(left, settings.PYBB_ATTACHMENT_CHUNK_SIZE))
+            if not chunk:
+                break
+            left -= len(chunk)
+            yield chunk
+    finally:
+        fobj.close()
+
+
+def serve_python(request, attachment):
+    path = attachment.get_absolute_path()
+    stat = os.stat(path)
+    size = stat.st_size
+    mtime = stat.st_mtime
+
+    if not_modified(request, attachment, mtime):
+        response = HttpResponseNotModified()
+        set_validators(response, attachment, mtime)
+        return response
+
+    byte_range = parse_range(request, attachment, mtime, size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */%d' % size
+        return response
+    elif byte_range is None:
+        start, stop = 0, size
+        status = 200
+    else:
+        start, stop = byte_range
+        status = 206
+
+    # without str() mod_python chokes with error that content_type must be string
+    response = HttpResponse(read_chunks(path, start, stop),
+                            content_type=str(attachment.content_type),
+                            status=status)
+    response['Content-Length'] = str(stop - start)
+    if status == 206:
+        response['Content-Range'] = 'bytes %d-%d/%d' % (start, stop - 1, size)
+    set_validators(response, attachment, mtime)
+    return response
+
+
+def serve_sendfile(request, attachment):
+    response = HttpResponse(content_type=str(attachment.content_type))
+    response['X-Sendfile'] = attachment.get_absolute_path()
+    response['ETag'] = '"%s"' % attachment.hash
+    return response
+
+
+def serve_accel_redirect(request, attachment):
+    response = HttpResponse(content_type=str(attachment.content_type))
+    response['X-Accel-Redirect'] = settings.PYBB_ATTACHMENT_ACCEL_PREFIX + \
+                                   attachment.path
+    response['ETag'] = '"%s"' % attachment.hash
+    return response
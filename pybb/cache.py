@@ -0,0 +1,86 @@
+"""
+Generational cache.
+
+Cached values are grouped into generations. The key of each value includes
+the current number of its generation, so incrementing the number invalidates
+all values cached under previous number without deleting them one by one.
+"""
+import time
+
+from django.core.cache import cache
+from django.conf import settings
+
+from pybb.models import Category, Forum, Post
+
+# Generations live longer than values cached under them
+GENERATION_TIMEOUT = 3600 * 24 * 30
+
+
+def generation_key(name):
+    return 'pybb:generation:%s' % name
+
+
+def get_generation(name):
+    key = generation_key(name)
+    value = cache.get(key)
+    if value is None:
+        # Start from current time in milliseconds so the generation
+        # does not return to old numbers if its key was evicted
+        value = int(time.time() * 1000)
+        cache.add(key, value, GENERATION_TIMEOUT)
+        value = cache.get(key) or value
+    return value
+
+
+def bump_generation(name):
+    try:
+        cache.incr(generation_key(name))
+    except ValueError:
+        get_generation(name)
+
+
+def get_or_set(generation, key, func, timeout=None):
+    """
+    Return value cached under the current number of the generation.
+
+    If there is no such value then calculate it with ``func`` and save.
+    """
+
+    full_key = 'pybb:%s:%s:%s' % (generation, get_generation(generation), key)
+    value = cache.get(full_key)
+    if value is None:
+        value = func()
+        cache.set(full_key, value, timeout or settings.PYBB_CACHE_TIMEOUT)
+    return value
+
+
+def load_forum_tree():
+    """
+    Return list of categories with forums and last posts of forums.
+
+    Forums of each category are stored in the ``cached_forums`` attribute.
+    """
+
+    cats = list(Category.objects.all())
+    cat_map = dict((x.pk, x) for x in cats)
+    for cat in cats:
+        cat.cached_forums = []
+    forums = list(Forum.objects.all())
+    pk_list = [x.last_post_id for x in forums]
+    qs = Post.objects.filter(pk__in=pk_list).select_related('user', 'topic')
+    posts = dict((x.pk, x) for x in qs)
+    for forum in forums:
+        forum.last_post = posts.get(forum.last_post_id)
+        cat_map[forum.category_id].cached_forums.append(forum)
+    return cats
+
+
+def get_forum_tree():
+    """
+    Return cached result of ``load_forum_tree``.
+
+    The cache is invalidated when any category, forum, topic or post is
+    saved or deleted.
+    """
+
+    return get_or_set('forum_tree', 'categories', load_forum_tree)
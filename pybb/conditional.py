@@ -0,0 +1,112 @@
+"""
+Conditional GET.
+
+Validators of pages are calculated from denormalized fields (``updated``,
+``post_count``, ``topic_count``) and cache generations, so a revalidation
+request is answered with 304 response after one cheap query instead of
+rendering the page.
+
+Pages of authenticated users depend on their read tracking, moderator
+rights and subscriptions, so the ETag of such pages includes the state of
+the user. Last-Modified header is sent only to anonymous users because the
+state of the user has no modification time.
+
+Changes of author profiles (avatars, signatures) do not change validators
+of topic pages until the topic itself is changed.
+"""
+from datetime import datetime
+from hashlib import md5
+
+from django.db.models import Max
+from django.views.decorators.http import condition
+from django.utils import translation
+
+from pybb.models import Forum, Topic
+from pybb.cache import get_generation
+from pybb.read_tracking import ReadMap
+from pybb.permissions import is_moderator, is_subscribed, get_profile, \
+                             request_user
+
+
+def user_state(user):
+    """
+    Return list of values which identify per-user parts of pages.
+    """
+
+    if not user.is_authenticated():
+        return ['anonymous']
+    tracking = user.readtracking
+    read_map = ReadMap(tracking.topics)
+    profile = get_profile(user)
+    return [user.pk, tracking.last_read, read_map.signature(),
+            profile.time_zone, profile.show_signatures, profile.markup]
+
+
+def conditional(state_func, per_user=True):
+    """
+    Decorator which handles conditional GET of the view.
+
+    ``state_func`` is called with the arguments of the view and returns
+    tuple of (last modification time, list of values identifying the content)
+    or None if the object does not exist. The state is calculated once
+    per request.
+    """
+
+    def get_state(request, *args, **kwargs):
+        if not hasattr(request, '_pybb_state'):
+            state = state_func(request, *args, **kwargs)
+            if state is not None:
+                last_modified, values = state
+                values = [request.path, request.META.get('QUERY_STRING', ''),
+                          translation.get_language()] + list(values)
+                if per_user:
+                    values += user_state(request_user(request))
+                etag = md5(repr(values)).hexdigest()
+                if per_user and request.user.is_authenticated():
+                    last_modified = None
+                state = (etag, last_modified)
+            request._pybb_state = state
+        return request._pybb_state
+
+    def etag_func(request, *args, **kwargs):
+        state = get_state(request, *args, **kwargs)
+        return state and state[0]
+
+    def last_modified_func(request, *args, **kwargs):
+        state = get_state(request, *args, **kwargs)
+        return state and state[1]
+
+    return condition(etag_func, last_modified_func)
+
+
+def index_state(request, *args, **kwargs):
+    generation = get_generation('forum_tree')
+    last_modified = Forum.objects.aggregate(Max('updated'))['updated__max']
+    return last_modified or datetime.now(), [generation]
+
+
+def forum_state(request, forum_id):
+    try:
+        forum = Forum.objects.filter(pk=forum_id)\
+                     .values('updated', 'topic_count', 'post_count')[0]
+    except (IndexError, ValueError):
+        return None
+    values = [forum['updated'], forum['topic_count'], forum['post_count'],
+              get_generation('forum:%s' % forum_id),
+              is_moderator(request_user(request), int(forum_id))]
+    return forum['updated'], values
+
+
+def topic_state(request, topic_id):
+    try:
+        topic = Topic.objects.filter(pk=topic_id)\
+                     .values('updated', 'created', 'post_count', 'forum',
+                             'name', 'sticky', 'closed')[0]
+    except (IndexError, ValueError):
+        return None
+    values = [topic['updated'], topic['post_count'], topic['name'],
+              topic['sticky'], topic['closed'],
+              get_generation('topic:%s' % topic_id),
+              is_moderator(request_user(request), topic['forum']),
+              is_subscribed(request_user(request), int(topic_id))]
+    return topic['updated'] or topic['created'], values
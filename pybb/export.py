@@ -1,8 +1,7 @@
 from django.conf import settings
 
-from common.pagination import paginate
-
-from pybb.views import load_last_post 
+from pybb.pagination import paginate_keyset
+from pybb.views import load_last_post
 
 def forum_details(forum, request):
     """
@@ -19,8 +18,11 @@ def forum_details(forum, request):
         request: ``Request`` object
     """
 
-    topics = forum.topics.order_by('-sticky', '-updated').select_related()
-    page = paginate(topics, request, settings.PYBB_FORUM_PAGE_SIZE)
+    page = paginate_keyset(forum.topics.select_related(), request,
+                           settings.PYBB_FORUM_PAGE_SIZE,
+                           ['-sticky', '-updated', '-id'],
+                           count=forum.topic_count,
+                           depth=settings.PYBB_FORUM_PAGINATION_DEPTH)
     load_last_post(page.object_list)
 
     return {'forum': forum,
@@ -1,12 +1,50 @@
+"""
+Syndication feeds.
+
+Feeds do not depend on the user, so rendered feeds are cached for everybody
+and tagged like cached pages (see ``pybb.page_cache``): feeds of the whole
+board are regenerated after any change of the content, feeds of a forum are
+regenerated after changes of its topics.
+"""
 from django.contrib.syndication.views import Feed
+from django.conf import settings
 from django.core.urlresolvers import reverse
 from django.utils.translation import ugettext as _
 from django.shortcuts import get_object_or_404
+from django.db.models import Max
 
 from pybb.models import Post, Topic, Forum
+from pybb.cache import get_generation
+from pybb.conditional import conditional
+from pybb.page_cache import cache_page
+
+
+def feed_cacheable(request):
+    return settings.PYBB_FEED_CACHE and request.method == 'GET'
 
 
 class PybbFeed(Feed):
+    def __call__(self, request, *args, **kwargs):
+        view = cache_page(self.feed_tags, cacheable_func=feed_cacheable)(
+            super(PybbFeed, self).__call__)
+        view = conditional(self.feed_state, per_user=False)(view)
+        return view(request, *args, **kwargs)
+
+    def feed_tags(self, request, *args):
+        """
+        Return tags of the cached feed.
+        """
+
+        return ['forum_tree']
+
+    def feed_state(self, request, *args):
+        """
+        Return state of the feed for conditional GET.
+        """
+
+        updated = Forum.objects.aggregate(Max('updated'))['updated__max']
+        return updated, [updated, get_generation('forum_tree')]
+
     def link(self):
         return reverse('pybb_index')
 
@@ -24,7 +62,9 @@ class LatestPostFeed(PybbFeed):
     description_template = 'pybb/feeds/posts_description.html'
 
     def items(self):
-        return Post.objects.order_by('-created')[:15]
+        return Post.objects.select_related('topic', 'user')\
+                           .defer('body', 'body_text', 'user_ip')\
+                           .order_by('-created')[:15]
 
 
 class LatestTopicFeed(PybbFeed):
@@ -34,7 +74,8 @@ class LatestTopicFeed(PybbFeed):
     description_template = 'pybb/feeds/topics_description.html'
 
     def items(self):
-        return Topic.objects.order_by('-created')[:15]
+        return Topic.objects.select_related('user')\
+                            .order_by('-created')[:15]
 
 
 class PybbForumFeed(PybbFeed):
@@ -46,7 +87,24 @@ class ForumFeed(PybbForumFeed):
         return _(u'Latest topics in %s forum' % obj)
 
     def items(self, obj):
-        return obj.topics.all().order_by('-created')[:15]
+        return obj.topics.select_related('user').order_by('-created')[:15]
+
+    def get_forum(self, request, *args):
+        """
+        Return the forum of the feed loaded once per request.
+        """
+
+        if not hasattr(request, '_pybb_feed_forum'):
+            request._pybb_feed_forum = self.get_object(request, *args)
+        return request._pybb_feed_forum
+
+    def feed_state(self, request, *args):
+        forum = self.get_forum(request, *args)
+        return forum.updated, [forum.updated, forum.topic_count,
+                               get_generation('forum_tree')]
+
+    def feed_tags(self, request, *args):
+        return ['forum:%s' % self.get_forum(request, *args).pk]
 
 
 class ForumByTagFeed(ForumFeed):
@@ -1,13 +1,17 @@
 import re
 from datetime import datetime
-import os.path
 
 from django import forms
 from django.conf import settings
 from django.utils.translation import ugettext as _
 from django.contrib.auth.models import User
 
-from pybb.models import Topic, Post, Profile, Attachment
+from pybb.models import Forum, Topic, Post, Profile, Attachment
+from pybb.permissions import get_profile
+from pybb.user_search import search_users
+from pybb.attachments import attach_file
+from pybb.cache import bump_generation
+from pybb.middleware import language_generation
 
 
 class AddPostForm(forms.ModelForm):
@@ -52,7 +56,7 @@ class AddPostForm(forms.ModelForm):
             topic = self.topic
 
         post = Post(topic=topic, user=self.user, user_ip=self.ip,
-                    markup=self.user.pybb_profile.markup,
+                    markup=get_profile(self.user).markup,
                     body=self.cleaned_data['body'])
         post.save()
 
@@ -66,21 +70,14 @@ class AddPostForm(forms.ModelForm):
         if memfile:
             obj = Attachment(size=memfile.size, content_type=memfile.content_type,
                              name=memfile.name, post=post)
-            dir = os.path.join(settings.MEDIA_ROOT, settings.PYBB_ATTACHMENT_UPLOAD_TO)
-            fname = '%d.0' % post.id
-            path = os.path.join(dir, fname)
-            if not os.path.exists(dir):
-                os.makedirs(dir)
-            file(path, 'w').write(memfile.read())
-            obj.path = fname
-            obj.save()
+            attach_file(obj, memfile)
 
 
 class EditProfileForm(forms.ModelForm):
     class Meta:
         model = Profile
         fields = ['signature', 'time_zone', 'language',
-                  'show_signatures', 'markup']
+                  'show_signatures', 'markup', 'notification_mode']
 
     def clean_signature(self):
         value = self.cleaned_data['signature'].strip()
@@ -90,6 +87,12 @@ class EditProfileForm(forms.ModelForm):
             raise forms.ValidationError('Length of signature is limited to %d' % settings.PYBB_SIGNATURE_MAX_LENGTH)
         return value
 
+    def save(self, *args, **kwargs):
+        profile = super(EditProfileForm, self).save(*args, **kwargs)
+        # reload the language cached in sessions of the user
+        bump_generation(language_generation(profile.user_id))
+        return profile
+
 
 class EditPostForm(forms.ModelForm):
     class Meta:
@@ -113,19 +116,35 @@ class EditHeadPostForm(EditPostForm):
     def save(self):
         post = super(EditPostForm, self).save(commit=False)
         post.updated = datetime.now()
-        post.save()
-
+        # the name is set before saving the post to index it with the post
         post.topic.name = self.cleaned_data['title']
+        post.save()
         post.topic.save()
         return post
 
 
+class SearchForm(forms.Form):
+    query = forms.CharField(label=_('Search'))
+    forum = forms.ModelChoiceField(Forum.objects.all(), required=False,
+                                   label=_('Forum'))
+    author = forms.CharField(required=False, label=_('Author'))
+
+    def clean_author(self):
+        username = self.cleaned_data['author'].strip()
+        if not username:
+            return None
+        try:
+            return User.objects.get(username=username)
+        except User.DoesNotExist:
+            raise forms.ValidationError(_('User does not exist'))
+
+
 class UserSearchForm(forms.Form):
     query = forms.CharField(required=False, label='')
 
     def filter(self, qs):
         if self.is_valid():
             query = self.cleaned_data['query']
-            return qs.filter(username__contains=query)
+            return search_users(qs, query)
         else:
             return qs
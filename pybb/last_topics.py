@@ -0,0 +1,136 @@
+"""
+Lists of recent topics.
+
+The cache holds bounded lists of the most recent topics of the whole board
+and of each forum, ordered by ``created`` or ``updated`` field. Lists of
+categories are merged from lists of their forums. Lists are updated in place
+when topics are saved or deleted, so reading them requires no queries while
+the cache is warm. Forums and categories of topics are taken from the cached
+forum tree, only authors of topics are stored with topics.
+
+Topics moved to another forum are removed from lists of the old forum.
+Concurrent updates of the same list could lose one of them, such lists are
+corrected when they expire after ``PYBB_CACHE_TIMEOUT``.
+"""
+from django.core.cache import cache
+from django.conf import settings
+
+from pybb.models import Topic
+from pybb.cache import get_forum_tree
+
+ORDERS = ('created', 'updated')
+
+
+def list_key(scope, order):
+    return 'pybb:last_topics:%s:%s' % (scope, order)
+
+
+def sort_key(order):
+    return lambda topic: (getattr(topic, order), topic.pk)
+
+
+def copy_topic(topic):
+    """
+    Return copy of the topic without cached related objects except its author.
+    """
+
+    copy = Topic(**dict((x.attname, getattr(topic, x.attname))
+                        for x in Topic._meta.fields))
+    copy._user_cache = topic.user
+    return copy
+
+
+def load_list(scope, order):
+    qs = Topic.objects.select_related('user')\
+                      .filter(**{'%s__isnull' % order: False})\
+                      .order_by('-%s' % order, '-id')
+    if scope != 'all':
+        qs = qs.filter(forum=scope.split(':')[1])
+    return list(qs[:settings.PYBB_LAST_TOPICS_SIZE])
+
+
+def get_lists(scopes, order):
+    """
+    Return dict of lists of given scopes, load missing lists.
+    """
+
+    keys = dict((list_key(x, order), x) for x in scopes)
+    lists = dict((keys[k], v) for k, v in cache.get_many(keys.keys()).items())
+    for scope in scopes:
+        if scope not in lists:
+            lists[scope] = load_list(scope, order)
+            cache.set(list_key(scope, order), lists[scope],
+                      settings.PYBB_CACHE_TIMEOUT)
+    return lists
+
+
+def update_list(scope, order, topic, deleted=False):
+    """
+    Replace the topic in the cached list.
+
+    Return the old copy of the topic if it was in the list.
+    """
+
+    key = list_key(scope, order)
+    topics = cache.get(key)
+    if topics is None:
+        return None
+
+    old = [x for x in topics if x.pk == topic.pk]
+    topics = [x for x in topics if x.pk != topic.pk]
+    if deleted or getattr(topic, order) is None:
+        if old and len(topics) + 1 >= settings.PYBB_LAST_TOPICS_SIZE:
+            # the list can not be refilled without the query
+            cache.delete(key)
+            return old[0]
+    else:
+        topics.append(copy_topic(topic))
+        topics.sort(key=sort_key(order), reverse=True)
+        del topics[settings.PYBB_LAST_TOPICS_SIZE:]
+    cache.set(key, topics, settings.PYBB_CACHE_TIMEOUT)
+    return old and old[0] or None
+
+
+def update_topic(topic, deleted=False):
+    """
+    Update all lists which could contain the topic.
+    """
+
+    for order in ORDERS:
+        update_list('all', order, topic, deleted)
+        update_list('forum:%s' % topic.forum_id, order, topic, deleted)
+
+
+def get_last_topics(limit, category=None, forum=None, order='created'):
+    """
+    Return list of recent topics with attached forums and authors.
+    """
+
+    if order not in ORDERS:
+        raise ValueError('Invalid order: %s' % order)
+
+    forums = {}
+    for cat in get_forum_tree():
+        for obj in cat.cached_forums:
+            obj._category_cache = cat
+            forums[obj.pk] = obj
+
+    if forum:
+        scopes = ['forum:%s' % forum]
+    elif category:
+        scopes = ['forum:%s' % x.pk for x in forums.values()
+                  if x.category_id == int(category)]
+    else:
+        scopes = ['all']
+
+    topics = []
+    for items in get_lists(scopes, order).values():
+        topics.extend(items)
+    if len(scopes) > 1:
+        topics.sort(key=sort_key(order), reverse=True)
+    topics = topics[:limit]
+
+    for topic in topics:
+        if topic.forum_id in forums:
+            topic._forum_cache = forums[topic.forum_id]
+    return topics
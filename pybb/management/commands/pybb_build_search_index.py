@@ -0,0 +1,59 @@
+from optparse import make_option
+from multiprocessing import Pool
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Min, Max
+
+from pybb.models import Post
+from pybb.search import index_post
+
+
+def index_chunk(bounds):
+    """
+    Index posts with primary keys in the range [start, stop).
+    """
+
+    start, stop = bounds
+    count = 0
+    for post in Post.objects.filter(pk__gte=start, pk__lt=stop)\
+                            .select_related('topic').order_by('pk'):
+        index_post(post)
+        count += 1
+    return count
+
+
+class Command(BaseCommand):
+    help = 'Build the search index of existing posts'
+    option_list = BaseCommand.option_list + (
+        make_option('--chunk-size', dest='chunk_size', type='int',
+                    default=1000, help='Range of post ids indexed at once'),
+        make_option('--workers', dest='workers', type='int',
+                    default=1, help='Number of worker processes'),
+    )
+
+    def handle(self, *args, **kwargs):
+        chunk_size = kwargs['chunk_size']
+        bounds = Post.objects.aggregate(Min('pk'), Max('pk'))
+        if bounds['pk__min'] is None:
+            print 'Indexed posts: 0'
+            return
+        chunks = [(x, x + chunk_size) for x in
+                  xrange(bounds['pk__min'], bounds['pk__max'] + 1, chunk_size)]
+
+        if kwargs['workers'] > 1:
+            # workers should not share the connection of the parent process
+            connection.close()
+            pool = Pool(kwargs['workers'])
+            counts = pool.imap_unordered(index_chunk, chunks)
+        else:
+            counts = (index_chunk(x) for x in chunks)
+
+        count = 0
+        for index, chunk_count in enumerate(counts):
+            count += chunk_count
+            print 'Chunk %d of %d done' % (index + 1, len(chunks))
+        if kwargs['workers'] > 1:
+            pool.close()
+            pool.join()
+        print 'Indexed posts: %d' % count
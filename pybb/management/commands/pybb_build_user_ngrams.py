@@ -0,0 +1,28 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+
+from pybb.user_search import update_user_ngrams
+
+class Command(BaseCommand):
+    help = 'Fill the table of username trigrams used by substring user search'
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', dest='batch_size', type='int',
+                    default=1000, help='Number of users loaded at once'),
+    )
+
+    def handle(self, *args, **kwargs):
+        batch_size = kwargs['batch_size']
+        last_pk = 0
+        count = 0
+        while True:
+            users = list(User.objects.filter(pk__gt=last_pk).order_by('pk')
+                         .only('username')[:batch_size])
+            if not users:
+                break
+            for user in users:
+                update_user_ngrams(user)
+            count += len(users)
+            last_pk = users[-1].pk
+        print 'Processed users: %d' % count
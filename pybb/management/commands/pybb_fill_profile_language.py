@@ -0,0 +1,33 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+
+from pybb.models import Profile
+from pybb.cache import bump_generation
+from pybb.middleware import language_generation
+
+
+class Command(BaseCommand):
+    help = 'Set the language of profiles which have no language'
+    option_list = BaseCommand.option_list + (
+        make_option('--language', dest='language', default=None,
+                    help='Language code, LANGUAGE_CODE setting by default'),
+    )
+
+    def handle(self, *args, **kwargs):
+        languages = dict(settings.LANGUAGES)
+        language = kwargs['language']
+        if language is None:
+            language = settings.LANGUAGE_CODE
+            if language not in languages:
+                language = language.split('-')[0]
+        if language not in languages:
+            raise CommandError('Unknown language: %s' % language)
+
+        qs = Profile.objects.filter(language='')
+        user_ids = list(qs.values_list('user', flat=True))
+        qs.update(language=language)
+        for user_id in user_ids:
+            bump_generation(language_generation(user_id))
+        print 'Updated profiles: %d' % len(user_ids)
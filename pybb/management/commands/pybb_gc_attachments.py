@@ -0,0 +1,45 @@
+from optparse import make_option
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from pybb.models import Attachment
+from pybb.attachments import get_storage_dir
+
+class Command(BaseCommand):
+    help = 'Delete attachment files which are not referenced by any attachment'
+    option_list = BaseCommand.option_list + (
+        make_option('--min-age', dest='min_age', type='int', default=3600,
+                    help='Do not delete files modified less than given '
+                         'number of seconds ago (uploads in progress)'),
+        make_option('--dry-run', dest='dry_run', action='store_true',
+                    default=False, help='Only print files to delete'),
+    )
+
+    def handle(self, *args, **kwargs):
+        storage_dir = get_storage_dir()
+        threshold = time.time() - kwargs['min_age']
+        deleted = 0
+        size = 0
+
+        for root, dirs, files in os.walk(storage_dir):
+            paths = [os.path.relpath(os.path.join(root, x), storage_dir)
+                     for x in files]
+            used = set()
+            for start in xrange(0, len(paths), 500):
+                used.update(Attachment.objects
+                            .filter(path__in=paths[start:start + 500])
+                            .values_list('path', flat=True))
+            for path in paths:
+                full_path = os.path.join(storage_dir, path)
+                if path in used or os.path.getmtime(full_path) > threshold:
+                    continue
+                size += os.path.getsize(full_path)
+                deleted += 1
+                if kwargs['dry_run']:
+                    print path
+                else:
+                    os.remove(full_path)
+
+        print 'Deleted files: %d, freed: %d bytes' % (deleted, size)
@@ -0,0 +1,39 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+
+from pybb.models import Attachment
+from pybb import thumbnails
+
+class Command(BaseCommand):
+    help = 'Generate missing thumbnails of image attachments'
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', dest='batch_size', type='int',
+                    default=500, help='Number of attachments loaded at once'),
+    )
+
+    def handle(self, *args, **kwargs):
+        if thumbnails.Image is None:
+            raise CommandError('PIL is not installed')
+
+        last_pk = 0
+        ready = 0
+        failed = 0
+        while True:
+            items = list(Attachment.objects.filter(
+                pk__gt=last_pk,
+                content_type__in=settings.PYBB_THUMBNAIL_CONTENT_TYPES)
+                .order_by('pk')[:kwargs['batch_size']])
+            if not items:
+                break
+            for attachment in items:
+                for size in settings.PYBB_THUMBNAIL_SIZES:
+                    try:
+                        thumbnails.get_thumbnail(attachment, size, wait=True)
+                        ready += 1
+                    except Exception, ex:
+                        failed += 1
+                        print 'Attachment %d: %s' % (attachment.pk, ex)
+            last_pk = items[-1].pk
+        print 'Ready thumbnails: %d, failed: %d' % (ready, failed)
@@ -0,0 +1,32 @@
+from optparse import make_option
+import time
+
+from django.core.management.base import BaseCommand
+from django.conf import settings
+
+from pybb.subscription import send_digests
+
+class Command(BaseCommand):
+    help = 'Deliver due digests of subscription notifications'
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', dest='batch_size', type='int',
+                    default=settings.PYBB_NOTIFICATION_BATCH_SIZE,
+                    help='Number of messages sent through one connection'),
+    )
+
+    def handle(self, *args, **kwargs):
+        total_sent = 0
+        total_failed = 0
+        start = time.time()
+
+        while True:
+            sent, failed = send_digests(kwargs['batch_size'])
+            total_sent += sent
+            total_failed += failed
+            if not sent and not failed:
+                break
+
+        elapsed = time.time() - start
+        print 'Sent: %d, failed: %d' % (total_sent, total_failed)
+        print 'Time: %.2f sec, throughput: %.1f messages/sec' % (
+            elapsed, total_sent / max(elapsed, 0.001))
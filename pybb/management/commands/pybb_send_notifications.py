@@ -0,0 +1,39 @@
+from optparse import make_option
+import time
+
+from django.core.management.base import BaseCommand
+from django.conf import settings
+
+from pybb.subscription import send_notifications
+
+class Command(BaseCommand):
+    help = 'Deliver email notifications from the outbox'
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', dest='batch_size', type='int',
+                    default=settings.PYBB_NOTIFICATION_BATCH_SIZE,
+                    help='Number of messages sent through one connection'),
+        make_option('--loop', dest='loop', action='store_true', default=False,
+                    help='Do not exit when the outbox is empty, wait for new items'),
+        make_option('--sleep', dest='sleep', type='int', default=10,
+                    help='Seconds to wait for new items in loop mode'),
+    )
+
+    def handle(self, *args, **kwargs):
+        total_sent = 0
+        total_failed = 0
+        start = time.time()
+
+        while True:
+            sent, failed = send_notifications(kwargs['batch_size'])
+            total_sent += sent
+            total_failed += failed
+            if not sent and not failed:
+                if kwargs['loop']:
+                    time.sleep(kwargs['sleep'])
+                else:
+                    break
+
+        elapsed = time.time() - start
+        print 'Sent: %d, failed: %d' % (total_sent, total_failed)
+        print 'Time: %.2f sec, throughput: %.1f messages/sec' % (
+            elapsed, total_sent / max(elapsed, 0.001))
@@ -1,17 +1,61 @@
+"""
+Request setup.
+
+The language of the authenticated user is stored in the session together
+with the version of the profile language. ``EditProfileForm`` increments
+the version (see ``language_generation``), so the profile is loaded only
+after it was changed and the middleware makes no queries on other requests.
+Profiles without the language are served in the language of the request,
+``pybb_fill_profile_language`` command fills such profiles.
+
+The version is stored only in the cache, so all processes must use
+a shared cache backend (e.g. memcached), otherwise other processes keep
+the old language.
+
+The middleware does not load the user: ``request.pybb`` holds the
+request-scoped data of the user (see ``pybb.permissions.request_user``).
+"""
+from django.contrib.auth import SESSION_KEY
 from django.utils import translation
 
+from pybb.permissions import UserContext
+from pybb.cache import get_generation
+from pybb.models import Profile
+
+SESSION_LANGUAGE_KEY = 'pybb_language'
+
+
+def language_generation(user_id):
+    return 'language:%s' % user_id
+
+
+def get_profile_language(request, user_id):
+    """
+    Return the language of the profile cached in the session.
+    """
+
+    version = get_generation(language_generation(user_id))
+    cached = request.session.get(SESSION_LANGUAGE_KEY)
+    if cached and cached[:2] == (user_id, version):
+        return cached[2]
+    language = Profile.objects.filter(user=user_id)\
+                              .values_list('language', flat=True)
+    language = language and language[0] or ''
+    request.session[SESSION_LANGUAGE_KEY] = (user_id, version, language)
+    return language
+
 
 class PybbMiddleware(object):
     def process_request(self, request):
-        if request.user.is_authenticated():
-            profile = request.user.pybb_profile
-            language = translation.get_language_from_request(request)
+        # request.user is not touched, so the user is loaded only if needed
+        request.pybb = UserContext(request=request)
 
-            if not profile.language:
-                profile.language = language
-                profile.save()
+        # the id from the session does not require loading the user
+        user_id = hasattr(request, 'session') and request.session.get(SESSION_KEY)
+        if user_id:
+            language = get_profile_language(request, user_id)
 
-            if profile.language and profile.language != language:
-                request.session['django_language'] = profile.language
-                translation.activate(profile.language)
+            if language and language != translation.get_language_from_request(request):
+                request.session['django_language'] = language
+                translation.activate(language)
                 request.LANGUAGE_CODE = translation.get_language()
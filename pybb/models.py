@@ -1,7 +1,8 @@
 """
 Forum models:
 
-Category, Forum, Topic, Post, Profile, Attachment, ReadTracking
+Category, Forum, Topic, Post, Profile, Attachment, ReadTracking, Notification,
+Digest, SubscriptionState
 
 """
 from datetime import datetime
@@ -12,8 +13,8 @@ try:
 except ImportError:
     from sha import sha as sha1
 
-from django.db import models
-from django.db.models import F, Sum
+from django.db import models, transaction
+from django.db.models import F, Sum, Max
 from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
 from django.utils.html import strip_tags
@@ -145,12 +146,27 @@ class Topic(models.Model):
     def save(self, *args, **kwargs):
         if self.id is None:
             self.created = datetime.now()
+        # keyset pagination orders topics by ``updated`` which must be set
+        if self.updated is None:
+            self.updated = self.created
         super(Topic, self).save(*args, **kwargs)
 
     def update_post_count(self):
         self.post_count = self.posts.count()
         self.save()
 
+    def update_post_positions(self):
+        """
+        Renumber positions of all posts in the topic.
+
+        Also repairs duplicated or missing positions.
+        """
+
+        posts = self.posts.order_by('created', 'id').values_list('id', 'position')
+        for number, (pk, position) in enumerate(posts):
+            if position != number + 1:
+                Post.objects.filter(pk=pk).update(position=number + 1)
+
 
 class RenderableItem(models.Model):
     """
@@ -188,6 +204,7 @@ class Post(RenderableItem):
     body_html = models.TextField(_('HTML version'))
     body_text = models.TextField(_('Text version'))
     user_ip = models.IPAddressField(_('User IP'), blank=True, default='0.0.0.0')
+    position = models.IntegerField(_('Position'), blank=True, default=0)
 
     class Meta:
         ordering = ['created']
@@ -202,6 +219,13 @@ class Post(RenderableItem):
     __unicode__ = summary
 
     def save(self, *args, **kwargs):
+        if transaction.is_managed():
+            # the lock of the topic row is held by the caller's transaction
+            self._save(*args, **kwargs)
+        else:
+            transaction.commit_on_success(self._save)(*args, **kwargs)
+
+    def _save(self, *args, **kwargs):
         now = datetime.now()
         if self.created is None:
             self.created = now
@@ -209,6 +233,15 @@ class Post(RenderableItem):
 
         new = self.pk is None
 
+        if new:
+            # The no-op update locks the topic row until the commit, so
+            # concurrent posts of the topic get distinct positions
+            Topic.objects.filter(pk=self.topic_id)\
+                         .update(post_count=F('post_count'))
+            # 1-based number of the post in the topic
+            position = self.topic.posts.aggregate(Max('position'))['position__max']
+            self.position = (position or 0) + 1
+
         super(Post, self).save(*args, **kwargs)
 
         if new:
@@ -239,6 +272,10 @@ class Post(RenderableItem):
         else:
             super(Post, self).delete(*args, **kwargs)
 
+        if self_id != head_post_id:
+            self.topic.posts.filter(position__gt=self.position)\
+                            .update(position=F('position') - 1)
+
         self.topic.update_post_count()
         self.topic.forum.update_post_count()
 
@@ -248,6 +285,15 @@ BAN_STATUS = (
 (1, _('Caution')),
 (2, _('Ban')))
 
+NOTIFY_IMMEDIATELY = 0
+NOTIFY_HOURLY = 1
+NOTIFY_DAILY = 2
+
+NOTIFICATION_MODES = (
+(NOTIFY_IMMEDIATELY, _('Immediately')),
+(NOTIFY_HOURLY, _('Hourly digest')),
+(NOTIFY_DAILY, _('Daily digest')))
+
 
 class Profile(models.Model):
     user = models.OneToOneField(User, related_name='pybb_profile', verbose_name=_('User'))
@@ -261,6 +307,9 @@ class Profile(models.Model):
     ban_status = models.SmallIntegerField(_('Ban status'), default=0, choices=BAN_STATUS)
     ban_till = models.DateTimeField(_('Ban till'), blank=True, null=True, default=None)
     post_count = models.IntegerField(_('Post count'), blank=True, default=0)
+    notification_mode = models.SmallIntegerField(_('Subscription notifications'), default=NOTIFY_IMMEDIATELY,
+                                                 choices=NOTIFICATION_MODES)
+    avatar_url = models.CharField(_('Avatar URL'), max_length=255, blank=True)
 
     class Meta:
         verbose_name = _('Profile')
@@ -288,7 +337,7 @@ class Attachment(models.Model):
     post = models.ForeignKey(Post, verbose_name=_('Post'), related_name='attachments')
     size = models.IntegerField(_('Size'))
     content_type = models.CharField(_('Content type'), max_length=255)
-    path = models.CharField(_('Path'), max_length=255)
+    path = models.CharField(_('Path'), max_length=255, db_index=True)
     name = models.TextField(_('Name'))
     hash = models.CharField(_('Hash'), max_length=40, blank=True, db_index=True)
 
@@ -296,7 +345,7 @@ class Attachment(models.Model):
         super(Attachment, self).save(*args, **kwargs)
         if not self.hash:
             self.hash = sha1(str(self.id) + settings.SECRET_KEY).hexdigest()
-        super(Attachment, self).save(*args, **kwargs)
+            Attachment.objects.filter(pk=self.pk).update(hash=self.hash)
 
     def __unicode__(self):
         return self.name
@@ -304,6 +353,9 @@ class Attachment(models.Model):
     def get_absolute_url(self):
         return reverse('pybb_attachment_details', args=[self.hash])
 
+    def get_thumbnail_url(self, size='small'):
+        return reverse('pybb_attachment_thumbnail', args=[self.hash, size])
+
     def size_display(self):
         size = self.size
         if size < 1024:
@@ -327,7 +379,8 @@ class ReadTracking(models.Model):
     Model for tracking read/unread posts.
 
     `topics` field stores JSON serialized mapping of
-    `topic pk` --> `topic last post pk`
+    `topic pk` --> `[topic last read post pk, touch time]`.
+    See `pybb.read_tracking` for details.
     """
 
     user = models.OneToOneField(User)
@@ -347,4 +400,128 @@ class ReadTracking(models.Model):
         super(ReadTracking, self).save(*args, **kwargs)
 
 
+class Notification(models.Model):
+    """
+    Outbox item: email notification of the topic subscriber about new post.
+
+    Items are delivered with `pybb_send_notifications` command. Delivered items
+    are deleted. `next_attempt` is None for items which could not be delivered
+    in `PYBB_NOTIFICATION_MAX_ATTEMPTS` attempts.
+    """
+
+    user = models.ForeignKey(User, related_name='pybb_notifications', verbose_name=_('User'))
+    post = models.ForeignKey(Post, related_name='notifications', verbose_name=_('Post'))
+    created = models.DateTimeField(_('Created'))
+    attempts = models.IntegerField(_('Attempts'), blank=True, default=0)
+    next_attempt = models.DateTimeField(_('Next attempt'), blank=True, null=True, db_index=True)
+    error = models.TextField(_('Error'), blank=True)
+
+    class Meta:
+        verbose_name = _('Notification')
+        verbose_name_plural = _('Notifications')
+
+    def __unicode__(self):
+        return u'%s: %s' % (self.user.username, self.post_id)
+
+
+class Digest(models.Model):
+    """
+    Pending notifications of the user who prefers digest delivery.
+
+    `topics` field stores JSON serialized mapping of
+    `topic pk` --> `[first new post pk, number of new posts]`.
+    Digest is delivered with `pybb_send_digests` command after `due` time.
+    `due` is None for digests which could not be delivered in
+    `PYBB_NOTIFICATION_MAX_ATTEMPTS` attempts. `version` is incremented
+    on each change, rows are changed and deleted only if it is not changed
+    since they were loaded.
+    """
+
+    user = models.OneToOneField(User, related_name='pybb_digest', verbose_name=_('User'))
+    topics = JSONField(null=True, blank=True)
+    due = models.DateTimeField(_('Due'), db_index=True, null=True, blank=True)
+    attempts = models.IntegerField(_('Attempts'), blank=True, default=0)
+    error = models.TextField(_('Error'), blank=True, default='')
+    version = models.IntegerField(_('Version'), blank=True, default=0)
+
+    class Meta:
+        verbose_name = _('Digest')
+        verbose_name_plural = _('Digests')
+
+    def __unicode__(self):
+        return self.user.username
+
+
+class SubscriptionState(models.Model):
+    """
+    The post of the topic which the subscriber was notified about.
+
+    Further notifications about the topic are suppressed while the state
+    exists, it is deleted when the user reads the topic.
+    """
+
+    user = models.ForeignKey(User, related_name='pybb_subscription_states', verbose_name=_('User'))
+    topic = models.ForeignKey(Topic, related_name='subscription_states', verbose_name=_('Topic'))
+    post = models.ForeignKey(Post, related_name='subscription_states', verbose_name=_('Post'))
+
+    class Meta:
+        unique_together = (('user', 'topic'),)
+        verbose_name = _('Subscription state')
+        verbose_name_plural = _('Subscription states')
+
+    def __unicode__(self):
+        return u'%s: %s' % (self.user.username, self.topic_id)
+
+
+class UserNgram(models.Model):
+    """
+    Trigram of the lowercased username, see ``pybb.user_search``.
+    """
+
+    user = models.ForeignKey(User, related_name='pybb_ngrams', verbose_name=_('User'))
+    ngram = models.CharField(_('N-gram'), max_length=3)
+
+    class Meta:
+        unique_together = (('ngram', 'user'),)
+        verbose_name = _('Username n-gram')
+        verbose_name_plural = _('Username n-grams')
+
+    def __unicode__(self):
+        return u'%s: %s' % (self.user_id, self.ngram)
+
+
+class SearchTerm(models.Model):
+    """
+    Term of the search index, see ``pybb.search``.
+    """
+
+    term = models.CharField(_('Term'), max_length=50, unique=True)
+    post_count = models.IntegerField(_('Post count'), blank=True, default=0)
+
+    class Meta:
+        verbose_name = _('Search term')
+        verbose_name_plural = _('Search terms')
+
+    def __unicode__(self):
+        return self.term
+
+
+class SearchPosting(models.Model):
+    """
+    Occurrence of the term in the post, see ``pybb.search``.
+    """
+
+    term = models.ForeignKey(SearchTerm, related_name='postings', verbose_name=_('Term'))
+    post = models.ForeignKey(Post, related_name='search_postings', verbose_name=_('Post'))
+    weight = models.IntegerField(_('Weight'))
+
+    class Meta:
+        unique_together = (('term', 'post'),)
+        verbose_name = _('Search posting')
+        verbose_name_plural = _('Search postings')
+
+    def __unicode__(self):
+        return u'%s: %s' % (self.term_id, self.post_id)
+
+
 import pybb.signals
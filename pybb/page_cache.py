@@ -0,0 +1,133 @@
+"""
+Page cache for anonymous visitors.
+
+Pages are cached by URL and language. Each cached page is tagged with
+names of generations (see ``pybb.cache``) of the content it displays:
+
+    topic:<pk>: posts and attributes of the topic
+    forum:<pk>: list of topics of the forum
+    forum_tree: categories, forums and their last posts
+
+Writes purge tags of affected content by incrementing their generations, so
+cached pages with old generations are not served anymore. The same tags
+are sent in ``PYBB_PAGE_CACHE_TAGS_HEADER`` header of the response and
+passed to functions listed in ``PYBB_PAGE_CACHE_PURGE_HOOKS``, so the cache
+of an upstream reverse proxy could be invalidated in the same way.
+"""
+from hashlib import md5
+
+from django.core.cache import cache
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils import translation
+from django.utils.importlib import import_module
+
+from pybb.cache import get_generation, bump_generation, generation_key
+
+
+_hooks = None
+
+
+def get_purge_hooks():
+    global _hooks
+    if _hooks is None:
+        hooks = []
+        for path in settings.PYBB_PAGE_CACHE_PURGE_HOOKS:
+            module, name = path.rsplit('.', 1)
+            hooks.append(getattr(import_module(module), name))
+        _hooks = hooks
+    return _hooks
+
+
+def purge(tags):
+    """
+    Invalidate cached pages tagged with any of given tags.
+    """
+
+    for tag in tags:
+        bump_generation(tag)
+    for hook in get_purge_hooks():
+        hook(tags)
+
+
+def page_key(request):
+    url = '%s?%s' % (request.path, request.META.get('QUERY_STRING', ''))
+    path = md5(url).hexdigest()
+    return 'pybb:page:%s:%s' % (translation.get_language(), path)
+
+
+def get_generations(tags):
+    """
+    Return mapping of tag to the current number of its generation.
+
+    Tags without generation are missing in the result.
+    """
+
+    values = cache.get_many([generation_key(x) for x in tags])
+    return dict((x, values[generation_key(x)]) for x in tags
+                if generation_key(x) in values)
+
+
+def cacheable(request):
+    return settings.PYBB_PAGE_CACHE and request.method == 'GET'\
+           and not request.user.is_authenticated()
+
+
+def cache_page(tags_func, hit_func=None, cacheable_func=cacheable):
+    """
+    Decorator which caches the page of the view for anonymous visitors.
+
+    ``tags_func`` is called with the arguments of the view and returns
+    list of tags of the page. ``hit_func`` is called with the arguments
+    of the view when the page is served from the cache. ``cacheable_func``
+    is called with the request and tells if the page could be cached.
+    """
+
+    def decorator(func):
+        def wrapper(request, *args, **kwargs):
+            if not cacheable_func(request):
+                return func(request, *args, **kwargs)
+
+            key = page_key(request)
+            entry = cache.get(key)
+            if entry is not None:
+                tags, content, content_type = entry
+                if get_generations(tags.keys()) == tags:
+                    if hit_func:
+                        hit_func(request, *args, **kwargs)
+                    response = HttpResponse(content, content_type=content_type)
+                    set_tags_header(response, tags.keys())
+                    return response
+
+            tags = tags_func(request, *args, **kwargs)
+            # generations are fetched before rendering, so writes
+            # made during rendering invalidate the page
+            generations = dict((x, get_generation(x)) for x in tags)
+            response = func(request, *args, **kwargs)
+            # pages with CSRF tokens or cookies are personal
+            if response.status_code == 200 and not response.cookies\
+               and not request.META.get('CSRF_COOKIE_USED'):
+                cache.set(key, (generations, response.content,
+                                response['Content-Type']),
+                          settings.PYBB_PAGE_CACHE_TIMEOUT)
+            set_tags_header(response, tags)
+            return response
+        return wrapper
+    return decorator
+
+
+def set_tags_header(response, tags):
+    if settings.PYBB_PAGE_CACHE_TAGS_HEADER:
+        response[settings.PYBB_PAGE_CACHE_TAGS_HEADER] = ' '.join(sorted(tags))
+
+
+def index_tags(request, *args, **kwargs):
+    return ['forum_tree']
+
+
+def forum_tags(request, forum_id):
+    return ['forum:%s' % forum_id]
+
+
+def topic_tags(request, topic_id):
+    return ['topic:%s' % topic_id]
@@ -0,0 +1,392 @@
+"""
+Keyset pagination.
+
+First pages are addressed with page numbers, deeper pages are addressed with
+cursors, i.e. values of ordering fields of the first or the last object on
+the page. Selecting the page by cursor does not require the database to scan
+all previous rows as OFFSET does.
+
+Query string arguments:
+    page: number of the page
+    after: cursor of the last object on the previous page
+    before: cursor of the first object on the next page or "last"
+
+Pages of objects with stored positions are selected with the range
+of positions, see ``paginate_positions``.
+
+The page objects provide attributes of pages built with
+``common.pagination.paginate`` so the same templates could be used to
+display pagination links.
+
+Links to pages of topics in topic lists are built with ``mini_pagination``
+from the topic URL reversed once, ``load_mini_pagination`` builds them for
+the whole list of topics.
+"""
+from datetime import datetime
+import time
+
+from django.conf import settings
+from django.core.paginator import Paginator, Page, EmptyPage, InvalidPage
+from django.core.urlresolvers import reverse, get_urlconf, get_script_prefix
+from django.db import models
+from django.db.models import Q
+
+from common.templatetags.common_tags import alter_qs
+
+
+def page_qs(query_string, name, value):
+    """
+    Return query string with only one of page arguments set.
+    """
+
+    for arg in ('page', 'after', 'before'):
+        if arg != name:
+            query_string = alter_qs(query_string, arg, None)
+    return alter_qs(query_string, name, value)
+
+
+def encode_value(field, value):
+    if value is None:
+        return ''
+    elif isinstance(field, models.DateTimeField):
+        return value.strftime('%Y%m%d%H%M%S') + '%06d' % value.microsecond
+    elif isinstance(field, models.BooleanField):
+        return value and '1' or '0'
+    elif isinstance(field, models.CharField):
+        # hex encoding keeps separators of the cursor out of the value
+        return value.encode('utf-8').encode('hex')
+    else:
+        return str(int(value))
+
+
+def decode_value(field, value):
+    if isinstance(field, models.DateTimeField):
+        if len(value) != 20:
+            raise ValueError('Invalid datetime value: %s' % value)
+        args = time.strptime(value[:14], '%Y%m%d%H%M%S')[:6]
+        return datetime(*args + (int(value[14:]),))
+    elif isinstance(field, models.BooleanField):
+        return value == '1'
+    elif isinstance(field, models.CharField):
+        try:
+            return value.decode('hex').decode('utf-8')
+        except (TypeError, UnicodeDecodeError):
+            raise ValueError('Invalid string value: %s' % value)
+    else:
+        return int(value)
+
+
+def encode_cursor(obj, fields):
+    return '.'.join(encode_value(x, getattr(obj, x.attname)) for x in fields)
+
+
+def decode_cursor(cursor, fields):
+    values = cursor.split('.')
+    if len(values) != len(fields):
+        raise ValueError('Invalid cursor: %s' % cursor)
+    return [decode_value(x, y) for x, y in zip(fields, values)]
+
+
+def keyset_filter(keys, values, forward):
+    """
+    Build condition which selects objects placed after (or before if
+    ``forward`` is False) the object with given values of ordering fields.
+
+    Args:
+        keys: list of (field name, descending) pairs
+        values: list of values of ordering fields
+    """
+
+    condition = None
+    for (name, desc), value in reversed(zip(keys, values)):
+        if desc == forward:
+            lookup = '%s__lt' % name
+        else:
+            lookup = '%s__gt' % name
+        if condition is None:
+            condition = Q(**{lookup: value})
+        else:
+            condition = Q(**{lookup: value}) | (Q(**{name: value}) & condition)
+    return condition
+
+
+class KeysetPaginator(object):
+    def __init__(self, num_pages, frame):
+        self.num_pages = num_pages
+        self.frame = frame
+        if frame:
+            self.frame_start_page = frame[0][0]
+            self.frame_end_page = frame[-1][0]
+        else:
+            self.frame_start_page = self.frame_end_page = 1
+
+
+class KeysetPage(object):
+    """
+    Page of objects selected with the cursor.
+
+    The number of the page is unknown and is None.
+    """
+
+    number = None
+
+    def __init__(self, object_list, paginator, previous_page_url, next_page_url,
+                 first_page_url, last_page_url):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.previous_page_url = previous_page_url
+        self.next_page_url = next_page_url
+        self.first_page_url = first_page_url
+        self.last_page_url = last_page_url
+
+    def has_previous(self):
+        return self.previous_page_url is not None
+
+    def has_next(self):
+        return self.next_page_url is not None
+
+    def has_other_pages(self):
+        return self.has_previous() or self.has_next()
+
+
+def paginate_keyset(qs, request, per_page, ordering, count=None, depth=None,
+                    frame_size=10):
+    """
+    Return page of objects selected with the page number or with the cursor.
+
+    Args:
+        qs: queryset which should be paginated
+        request: django request object
+        per_page: number of objects per page
+        ordering: list of field names as for ``order_by``, the last field
+            must be unique
+        count: known number of objects, it is used instead of COUNT query
+        depth: number of pages linked with page numbers, the links to
+            further pages use cursors. None means no limit.
+        frame_size: number of visible pages
+    """
+
+    keys = [(x.lstrip('-'), x.startswith('-')) for x in ordering]
+    fields = [qs.model._meta.get_field(x[0]) for x in keys]
+    query_string = request.META.get('QUERY_STRING', '')
+
+    paginator = Paginator(qs.order_by(*ordering), per_page)
+    if count is not None:
+        paginator._count = count
+
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    if after or before:
+        try:
+            return cursor_page(qs, request, per_page, ordering, keys, fields,
+                               paginator.num_pages, depth, frame_size)
+        except ValueError:
+            pass
+
+    try:
+        number = int(request.GET.get('page', 1))
+    except ValueError:
+        number = 1
+    try:
+        page = paginator.page(number)
+    except (EmptyPage, InvalidPage):
+        page = paginator.page(1)
+    page.object_list = list(page.object_list)
+
+    set_page_urls(page, query_string, frame_size, depth, fields)
+    return page
+
+
+def set_page_urls(page, query_string, frame_size, depth=None, fields=None):
+    """
+    Set links to other pages on the page addressed with the page number.
+
+    If ``depth`` is given then pages after it are linked with cursors built
+    from values of ``fields``.
+    """
+
+    paginator = page.paginator
+    if page.has_previous():
+        page.previous_page_url = page_qs(query_string, 'page', page.previous_page_number())
+    else:
+        page.previous_page_url = None
+
+    if not page.has_next():
+        page.next_page_url = None
+    elif depth and page.number >= depth and page.object_list:
+        cursor = encode_cursor(page.object_list[-1], fields)
+        page.next_page_url = page_qs(query_string, 'after', cursor)
+    else:
+        page.next_page_url = page_qs(query_string, 'page', page.next_page_number())
+
+    page.first_page_url = page_qs(query_string, 'page', 1)
+    if depth and paginator.num_pages > depth:
+        page.last_page_url = page_qs(query_string, 'before', 'last')
+    else:
+        page.last_page_url = page_qs(query_string, 'page', paginator.num_pages)
+
+    start = max(1, page.number - frame_size / 2)
+    stop = min(paginator.num_pages, start + frame_size - 1)
+    if depth and page.number <= depth:
+        stop = min(stop, depth)
+    start = max(1, min(start, stop - frame_size + 1))
+    paginator.frame = [(x, page_qs(query_string, 'page', x))
+                       for x in xrange(start, stop + 1)]
+    paginator.frame_start_page = start
+    paginator.frame_end_page = stop
+
+
+class PositionPaginator(Paginator):
+    """
+    Paginator of objects with stored 1-based positions.
+
+    Page is selected with the range of positions instead of OFFSET.
+    """
+
+    def __init__(self, object_list, per_page, count, field='position'):
+        super(PositionPaginator, self).__init__(object_list, per_page)
+        self._count = count
+        self.field = field
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        top = bottom + self.per_page
+        qs = self.object_list.filter(**{'%s__gt' % self.field: bottom,
+                                        '%s__lte' % self.field: top})
+        return Page(list(qs.order_by(self.field)), number, self)
+
+
+def paginate_positions(qs, request, per_page, count, field='position',
+                       frame_size=10):
+    """
+    Return page of objects selected with the range of stored positions.
+
+    Args:
+        qs: queryset which should be paginated
+        request: django request object
+        per_page: number of objects per page
+        count: number of objects
+        field: name of the field which stores position of the object
+        frame_size: number of visible pages
+    """
+
+    paginator = PositionPaginator(qs, per_page, count, field)
+    try:
+        number = int(request.GET.get('page', 1))
+    except ValueError:
+        number = 1
+    try:
+        page = paginator.page(number)
+    except (EmptyPage, InvalidPage):
+        page = paginator.page(1)
+    set_page_urls(page, request.META.get('QUERY_STRING', ''), frame_size)
+    return page
+
+
+def cursor_page(qs, request, per_page, ordering, keys, fields, num_pages,
+                depth, frame_size):
+    """
+    Return page of objects placed after or before the cursor.
+
+    Raise ValueError if the cursor is invalid.
+    """
+
+    query_string = request.META.get('QUERY_STRING', '')
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+
+    if before:
+        backward = True
+        cursor = before
+        # reverse the ordering to select objects placed before the cursor
+        ordering = [x.startswith('-') and x[1:] or '-' + x for x in ordering]
+    else:
+        backward = False
+        cursor = after
+
+    if cursor != 'last':
+        values = decode_cursor(cursor, fields)
+        qs = qs.filter(keyset_filter(keys, values, not backward))
+
+    object_list = list(qs.order_by(*ordering)[:per_page + 1])
+    more = len(object_list) > per_page
+    object_list = object_list[:per_page]
+    if backward:
+        object_list.reverse()
+        has_previous = more
+        has_next = cursor != 'last'
+    else:
+        has_previous = True
+        has_next = more
+
+    previous_page_url = next_page_url = None
+    if has_previous:
+        if object_list:
+            cursor = encode_cursor(object_list[0], fields)
+            previous_page_url = page_qs(query_string, 'before', cursor)
+        else:
+            previous_page_url = page_qs(query_string, 'page', 1)
+    if has_next and object_list:
+        cursor = encode_cursor(object_list[-1], fields)
+        next_page_url = page_qs(query_string, 'after', cursor)
+
+    stop = min(num_pages, frame_size, depth or frame_size)
+    frame = [(x, page_qs(query_string, 'page', x)) for x in xrange(1, stop + 1)]
+    paginator = KeysetPaginator(num_pages, frame)
+    return KeysetPage(object_list, paginator, previous_page_url, next_page_url,
+                      page_qs(query_string, 'page', 1),
+                      page_qs(query_string, 'before', 'last'))
+
+
+TOPIC_URL_MARKER = '999999999'
+_topic_url_templates = {}
+
+
+def get_topic_url_template():
+    """
+    Return the URL of topic with ``%d`` in place of topic id.
+
+    The URL is reversed once per URLconf and script prefix.
+    """
+
+    key = (get_urlconf(), get_script_prefix())
+    try:
+        return _topic_url_templates[key]
+    except KeyError:
+        url = reverse('pybb_topic_details', args=[TOPIC_URL_MARKER])
+        template = url.replace('%', '%%').replace(TOPIC_URL_MARKER, '%d')
+        _topic_url_templates[key] = template
+        return template
+
+
+def mini_pagination(topic, url_template=None):
+    """
+    Return HTML links to first and last pages of the topic.
+
+    Return empty string if the topic has only one page.
+    """
+
+    page_size = settings.PYBB_TOPIC_PAGE_SIZE
+    if topic.post_count <= page_size:
+        return u''
+    if url_template is None:
+        url_template = get_topic_url_template()
+    link = u'<a href="%s?page=%%(p)s">%%(p)s</a>' % (url_template % topic.pk)
+    page_count = ((topic.post_count - 1) / page_size) + 1
+    if page_count > 4:
+        pages = [1, 2, page_count - 1, page_count]
+        links = [link % {'p': page} for page in pages]
+        return u'%s, %s ... %s, %s' % tuple(links)
+    else:
+        return u', '.join(link % {'p': page} for page in range(1, page_count + 1))
+
+
+def load_mini_pagination(topics):
+    """
+    Store pagination links of each topic in ``mini_pagination`` attribute.
+    """
+
+    url_template = get_topic_url_template()
+    for topic in topics:
+        topic.mini_pagination = mini_pagination(topic, url_template)
@@ -0,0 +1,159 @@
+"""
+Permission checks.
+
+If the user has ``pybb_context`` attribute then checks are done in memory
+with data loaded once per request. ``PybbMiddleware`` creates the context
+of the request without loading the user, the attribute is set when
+the user is taken with ``request_user``.
+Otherwise membership of the user in forum moderators and topic subscribers
+is checked with EXISTS-style queries to the intermediate tables of
+many-to-many relations. User objects of moderators and subscribers are
+never loaded.
+"""
+from pybb.models import Forum, Topic
+
+
+class UserContext(object):
+    """
+    Request-scoped data of the user.
+
+    Each attribute is loaded on first access and is kept until
+    the end of the request. The context is created either for the user
+    or for the request whose user is loaded on first access.
+    """
+
+    def __init__(self, user=None, request=None):
+        self._user = user
+        self.request = request
+
+    @property
+    def user(self):
+        if self._user is None:
+            self._user = self.request.user
+            self._user.pybb_context = self
+        return self._user
+
+    @property
+    def profile(self):
+        if not hasattr(self, '_profile'):
+            if self.user.is_authenticated():
+                self._profile = self.user.pybb_profile
+            else:
+                self._profile = None
+        return self._profile
+
+    @property
+    def is_banned(self):
+        if not hasattr(self, '_is_banned'):
+            self._is_banned = bool(self.profile and self.profile.is_banned())
+        return self._is_banned
+
+    @property
+    def moderated_forums(self):
+        """
+        Set of pks of forums moderated by the user.
+        """
+
+        if not hasattr(self, '_moderated_forums'):
+            if self.user.is_authenticated():
+                qs = Forum.moderators.through.objects.filter(user=self.user.pk)
+                self._moderated_forums = set(qs.values_list('forum', flat=True))
+            else:
+                self._moderated_forums = set()
+        return self._moderated_forums
+
+    @property
+    def subscriptions(self):
+        """
+        Set of pks of topics which the user is subscribed on.
+        """
+
+        if not hasattr(self, '_subscriptions'):
+            if self.user.is_authenticated():
+                qs = Topic.subscribers.through.objects.filter(user=self.user.pk)
+                self._subscriptions = set(qs.values_list('topic', flat=True))
+            else:
+                self._subscriptions = set()
+        return self._subscriptions
+
+
+def request_user(request):
+    """
+    Return the user of the request with the request-scoped data attached.
+    """
+
+    context = getattr(request, 'pybb', None)
+    if context is not None:
+        return context.user
+    return request.user
+
+
+def get_profile(user):
+    """
+    Return the profile of the user using request-scoped data if available.
+    """
+
+    context = getattr(user, 'pybb_context', None)
+    if context is not None:
+        return context.profile
+    return user.pybb_profile
+
+
+def is_banned(user):
+    context = getattr(user, 'pybb_context', None)
+    if context is not None:
+        return context.is_banned
+    return user.pybb_profile.is_banned()
+
+
+def is_moderator(user, forum_id):
+    """
+    Check if the user is superuser or moderator of the forum.
+    """
+
+    if user.is_superuser:
+        return True
+    if not user.is_authenticated():
+        return False
+    context = getattr(user, 'pybb_context', None)
+    if context is not None:
+        return forum_id in context.moderated_forums
+    return Forum.moderators.through.objects.filter(
+        forum=forum_id, user=user.pk).exists()
+
+
+def is_subscribed(user, topic_id):
+    """
+    Check if the user is subscribed on the topic.
+    """
+
+    if not user.is_authenticated():
+        return False
+    context = getattr(user, 'pybb_context', None)
+    if context is not None:
+        return topic_id in context.subscriptions
+    return Topic.subscribers.through.objects.filter(
+        topic=topic_id, user=user.pk).exists()
+
+
+def can_edit_post(user, post):
+    """
+    Check if the post could be edited by the user.
+    """
+
+    if user.is_authenticated() and post.user_id == user.pk:
+        return True
+    return is_moderator(user, post.topic.forum_id)
+
+
+def can_delete_post(user, post):
+    """
+    Check if the post could be deleted by the user.
+
+    Users could delete their own posts only if the post is the last in topic.
+    """
+
+    if user.is_authenticated() and post.user_id == user.pk and \
+       post.pk == post.topic.last_post_id:
+        return True
+    return is_moderator(user, post.topic.forum_id)
@@ -1,6 +1,92 @@
+"""
+Read tracking.
+
+``ReadTracking.topics`` maps ``topic pk`` to ``[last read post pk, touch time]``
+where touch time is an unix timestamp of the last update of the entry.
+The map is bounded with ``PYBB_READ_TRACKING_LIMIT`` entries. On overflow the
+least recently touched entries are evicted and ``ReadTracking.last_read``
+is advanced to the oldest touch time of the evicted entries, so topics
+updated after that time are not reported as read.
+"""
+import time
 from datetime import datetime
 
+from django.conf import settings
+
+from pybb.models import SubscriptionState
+from pybb.permissions import is_subscribed
+
+
+class ReadMap(object):
+    """
+    LRU-bounded mapping of ``topic pk`` --> ``last read post pk``.
+
+    Old style entries which contain only post pk are considered
+    as the least recently touched.
+    """
+
+    def __init__(self, data=None, limit=None):
+        if isinstance(data, dict):
+            self.data = data
+        else:
+            self.data = {}
+        self.limit = limit or settings.PYBB_READ_TRACKING_LIMIT
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, topic_pk, default=0):
+        value = self.data.get(str(topic_pk))
+        if value is None:
+            return default
+        if isinstance(value, list):
+            return value[0]
+        return value
+
+    def signature(self):
+        """
+        Return value which changes when any entry is added, advanced or evicted.
+        """
+
+        return len(self.data), sum(self.get(x) for x in self.data)
+
+    def touch(self, topic_pk, post_pk, timestamp=None):
+        if timestamp is None:
+            timestamp = int(time.time())
+        self.data[str(topic_pk)] = [post_pk, timestamp]
+
+    def evict(self):
+        """
+        Remove least recently touched entries which do not fit into the limit.
+
+        Return the datetime of the oldest touch among evicted entries
+        or None if nothing was evicted or old style entries were evicted.
+        """
+
+        overflow = len(self.data) - self.limit
+        if overflow <= 0:
+            return None
+        items = sorted(self.data.items(), key=lambda x: touch_time(x[1]))
+        victims = items[:overflow]
+        for key, value in victims:
+            del self.data[key]
+        timestamp = touch_time(victims[0][1])
+        if timestamp:
+            return datetime.fromtimestamp(timestamp)
+        return None
+
+
+def touch_time(value):
+    if isinstance(value, list):
+        return value[1]
+    return 0
+
+
 def update_read_tracking(topic, user):
+    if settings.PYBB_NOTIFY_UNTIL_VISITED and is_subscribed(user, topic.pk):
+        # the visit enables notifications about the next post
+        SubscriptionState.objects.filter(user=user.pk, topic=topic.pk).delete()
+
     tracking = user.readtracking
 
     # if last_read > last_read - don't check topics
@@ -8,17 +94,15 @@ def update_read_tracking(topic, user):
                                                     topic.last_post.created):
         return
 
-    if isinstance(tracking.topics, dict):
-        # clear topics if len > 5Kb and set last_read to current time
-        if len(tracking.topics) > 5120:
-            tracking.topics = None
-            tracking.last_read = datetime.now()
-            tracking.save()
-        # update topics if new post exists or cache entry is empty
-        if topic.last_post.pk > tracking.topics.get(str(topic.pk), 0):
-            tracking.topics[str(topic.pk)] = topic.last_post.pk
-            tracking.save()
-    else:
-        # initialize topic tracking dict
-        tracking.topics = {topic.pk: topic.last_post.pk}
+    read_map = ReadMap(tracking.topics)
+
+    # update topics if new post exists or cache entry is empty
+    if topic.last_post.pk > read_map.get(topic.pk):
+        read_map.touch(topic.pk, topic.last_post.pk)
+        # evicted topics are covered by the advanced last_read mark
+        watermark = read_map.evict()
+        if watermark and (not tracking.last_read or
+                          watermark > tracking.last_read):
+            tracking.last_read = watermark
+        tracking.topics = read_map.data
         tracking.save()
@@ -0,0 +1,217 @@
+"""
+Full-text search of posts.
+
+Texts of posts and names of topics are split into terms with ``tokenize``.
+The inverted index consists of two tables: ``SearchTerm`` stores each term
+with the number of posts containing it, ``SearchPosting`` stores ids of
+posts containing the term with the weight of the term in the post. Terms
+of the topic name are indexed with the head post of the topic.
+
+The index is updated when posts are saved or deleted, only changed
+postings are written. ``pybb_build_search_index`` command builds the index
+for existing posts.
+
+Posts are selected if they contain all terms of the query. They are ranked
+with sum of weights of query terms multiplied by inverse document frequency
+of the term. Scores are integers, so the pair (score, post id) is used
+as the cursor of keyset pagination.
+"""
+import math
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+
+from pybb.models import Topic, Post, SearchTerm, SearchPosting
+from pybb.util import bulk_insert
+from pybb.cache import get_forum_tree
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+MAX_TERM_LENGTH = 50
+MAX_QUERY_TERMS = 10
+TITLE_WEIGHT = 5
+IDF_SCALE = 100
+
+
+def tokenize(text):
+    """
+    Return dict of lowercased terms of the text with number of occurrences.
+    """
+
+    terms = {}
+    for word in WORD_RE.findall(text.lower()):
+        if len(word) >= settings.PYBB_SEARCH_MIN_TERM_LENGTH:
+            word = word[:MAX_TERM_LENGTH]
+            terms[word] = terms.get(word, 0) + 1
+    return terms
+
+
+def get_post_terms(post):
+    """
+    Return dict of terms of the post with their weights.
+    """
+
+    terms = tokenize(post.body_text)
+    if post.position == 1:
+        for term in tokenize(post.topic.name):
+            terms[term] = terms.get(term, 0) + TITLE_WEIGHT
+    return terms
+
+
+def get_term_ids(terms):
+    """
+    Return mapping of terms to their ids, create missing terms.
+    """
+
+    ids = dict(SearchTerm.objects.filter(term__in=list(terms))
+               .values_list('term', 'id'))
+    for term in terms:
+        if term not in ids:
+            # get_or_create handles the term created by concurrent process
+            ids[term] = SearchTerm.objects.get_or_create(term=term)[0].pk
+    return ids
+
+
+def index_post(post):
+    """
+    Synchronize postings of the post with its text.
+    """
+
+    terms = get_post_terms(post)
+    current = dict((x[0], (x[1], x[2])) for x in SearchPosting.objects
+                   .filter(post=post.pk)
+                   .values_list('term__term', 'term', 'weight'))
+
+    removed = [current[x][0] for x in current if x not in terms]
+    if removed:
+        SearchPosting.objects.filter(post=post.pk, term__in=removed).delete()
+        SearchTerm.objects.filter(pk__in=removed)\
+                          .update(post_count=F('post_count') - 1)
+
+    for term, weight in terms.items():
+        if term in current and current[term][1] != weight:
+            SearchPosting.objects.filter(post=post.pk, term=current[term][0])\
+                                 .update(weight=weight)
+
+    added = [x for x in terms if x not in current]
+    if added:
+        ids = get_term_ids(added)
+        bulk_insert(SearchPosting, ('term_id', 'post_id', 'weight'),
+                    [(ids[x], post.pk, terms[x]) for x in added])
+        SearchTerm.objects.filter(pk__in=ids.values())\
+                          .update(post_count=F('post_count') + 1)
+
+
+def unindex_post(post):
+    """
+    Delete postings of the post.
+    """
+
+    term_ids = list(SearchPosting.objects.filter(post=post.pk)
+                    .values_list('term', flat=True))
+    if term_ids:
+        SearchPosting.objects.filter(post=post.pk).delete()
+        SearchTerm.objects.filter(pk__in=term_ids)\
+                          .update(post_count=F('post_count') - 1)
+
+
+def get_total_posts():
+    return sum(forum.post_count for cat in get_forum_tree()
+               for forum in cat.cached_forums)
+
+
+def get_query_terms(query):
+    """
+    Return list of (term id, idf) of the query terms.
+
+    Return None if some term is not in the index, so nothing could be found.
+    """
+
+    terms = tokenize(query).keys()[:MAX_QUERY_TERMS]
+    if not terms:
+        return None
+    found = list(SearchTerm.objects.filter(term__in=terms, post_count__gt=0)
+                 .values_list('id', 'post_count'))
+    if len(found) < len(terms):
+        return None
+    total = max(get_total_posts(), max(x[1] for x in found))
+    return [(pk, max(1, int(IDF_SCALE * math.log((total + 1.0) / count))))
+            for pk, count in found]
+
+
+def encode_cursor(score, post_id):
+    return '%d-%d' % (score, post_id)
+
+
+def decode_cursor(cursor):
+    score, post_id = cursor.split('-')
+    return int(score), int(post_id)
+
+
+def search_posts(query, limit, forum=None, user=None, after=None):
+    """
+    Return tuple of (list of found posts, cursor of the next page).
+
+    Posts have ``score`` attribute. ``after`` is the cursor returned for
+    the previous page.
+    """
+
+    terms = get_query_terms(query)
+    if not terms:
+        return [], None
+
+    qn = connection.ops.quote_name
+    cases = ' '.join(['WHEN %%s THEN sp.%s * %%s' % qn('weight')] * len(terms))
+    score = 'SUM(CASE sp.%s %s END)' % (qn('term_id'), cases)
+    score_params = []
+    for pk, idf in terms:
+        score_params += [pk, idf]
+
+    joins = ''
+    where = ['sp.%s IN (%s)' % (qn('term_id'), ', '.join(['%s'] * len(terms)))]
+    where_params = [x[0] for x in terms]
+    if forum or user:
+        joins = 'JOIN %s p ON p.%s = sp.%s JOIN %s t ON t.%s = p.%s' % (
+            qn(Post._meta.db_table), qn('id'), qn('post_id'),
+            qn(Topic._meta.db_table), qn('id'), qn('topic_id'))
+    if forum:
+        where.append('t.%s = %%s' % qn('forum_id'))
+        where_params.append(forum)
+    if user:
+        where.append('p.%s = %%s' % qn('user_id'))
+        where_params.append(user)
+
+    having = ['COUNT(*) = %s']
+    having_params = [len(terms)]
+    if after:
+        last_score, last_id = after
+        having.append('(%s < %%s OR (%s = %%s AND sp.%s < %%s))' % (
+            score, score, qn('post_id')))
+        having_params += score_params + [last_score] + score_params + \
+                         [last_score, last_id]
+
+    sql = 'SELECT sp.%s, %s FROM %s sp %s WHERE %s GROUP BY sp.%s ' \
+          'HAVING %s ORDER BY 2 DESC, 1 DESC LIMIT %d' % (
+              qn('post_id'), score, qn(SearchPosting._meta.db_table), joins,
+              ' AND '.join(where), qn('post_id'), ' AND '.join(having),
+              limit + 1)
+    cursor = connection.cursor()
+    cursor.execute(sql, score_params + where_params + having_params)
+    rows = cursor.fetchall()
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][1], rows[-1][0])
+    else:
+        next_cursor = None
+
+    posts = Post.objects.filter(pk__in=[x[0] for x in rows])\
+                        .select_related('topic', 'user')
+    posts = dict((x.pk, x) for x in posts)
+    result = []
+    for post_id, score in rows:
+        if post_id in posts:
+            posts[post_id].score = score
+            result.append(posts[post_id])
+    return result, next_cursor
@@ -2,15 +2,25 @@ from os.path import join
 
 PYBB_TOPIC_PAGE_SIZE = 10
 PYBB_FORUM_PAGE_SIZE = 20
+PYBB_FORUM_PAGINATION_DEPTH = 10 # pages, further pages are linked with cursors
 PYBB_USERS_PAGE_SIZE = 20
+PYBB_USER_SEARCH_NGRAMS = False # search users by substring with trigram table
+PYBB_SEARCH_ENABLE = True # index posts and enable the search view
+PYBB_SEARCH_PAGE_SIZE = 20
+PYBB_SEARCH_MIN_TERM_LENGTH = 2
+PYBB_API_PAGE_SIZE = 20
+PYBB_API_MAX_PAGE_SIZE = 100
 PYBB_AVATAR_WIDTH = 60
 PYBB_AVATAR_HEIGHT = 60
 PYBB_DEFAULT_TIME_ZONE = 3
+PYBB_CLIENT_TIME = False # render UTC times converted by javascript in the browser
 PYBB_SIGNATURE_MAX_LENGTH = 1024
 PYBB_SIGNATURE_MAX_LINES = 3
 PYBB_QUICK_TOPICS_NUMBER = 10
 PYBB_QUICK_POSTS_NUMBER = 10
+PYBB_LAST_TOPICS_SIZE = 20 # topics kept in cached lists of recent topics
 PYBB_READ_TIMEOUT = 3600 * 24 * 7 # seconds
+PYBB_READ_TRACKING_LIMIT = 5120
 #PYBB_POST_AUTOJOIN_ENABLED = True
 #PYBB_POST_AUTOJOIN_TIMEOUT = 60 * 60 # seconds
 PYBB_DEFAULT_MARKUP = 'bbcode'
@@ -18,7 +28,24 @@ PYBB_FREEZE_FIRST_POST = True
 PYBB_ADMIN_URL = '/admin/'
 PYBB_ATTACHMENT_SIZE_LIMIT = 1024 * 1024
 PYBB_ATTACHMENT_ENABLE = True
+PYBB_ATTACHMENT_DELIVERY = 'pybb.attachments.serve_python' # see pybb.attachments
+PYBB_ATTACHMENT_ACCEL_PREFIX = '/pybb_attachments/' # nginx internal location
+PYBB_ATTACHMENT_CHUNK_SIZE = 64 * 1024
+PYBB_THUMBNAIL_SIZES = {'small': (200, 200)} # name: bounding box
+PYBB_THUMBNAIL_CONTENT_TYPES = ('image/jpeg', 'image/png', 'image/gif')
+PYBB_THUMBNAIL_MAX_AGE = 3600 * 24 * 365 # seconds
 PYBB_SKIN = 'default'
+PYBB_NOTIFICATION_BATCH_SIZE = 100
+PYBB_NOTIFICATION_MAX_ATTEMPTS = 5
+PYBB_NOTIFICATION_RETRY_DELAY = 60 # seconds, doubled after each failed attempt
+PYBB_NOTIFY_UNTIL_VISITED = True
+PYBB_CACHE_TIMEOUT = 3600 * 24 # seconds
+PYBB_PAGE_CACHE = False # cache pages of anonymous visitors
+PYBB_PAGE_CACHE_TIMEOUT = 3600 # seconds
+PYBB_PAGE_CACHE_TAGS_HEADER = 'Surrogate-Key'
+PYBB_PAGE_CACHE_PURGE_HOOKS = () # dotted paths of functions called with list of purged tags
+PYBB_FEED_CACHE = True # cache rendered feeds
 
 PYBB_ATTACHMENT_UPLOAD_TO = join('pybb_upload', 'attachments')
+PYBB_THUMBNAIL_UPLOAD_TO = join('pybb_upload', 'thumbnails')
 PYBB_DEFAULT_AVATAR_URL = 'pybb/img/anonymous.gif'
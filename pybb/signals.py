@@ -1,30 +1,132 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_init, post_save, pre_delete, \
+                                      post_delete
 from django.contrib.auth.models import User
+from django.contrib.sites.models import Site
+from django.conf import settings
 
 from pybb.subscription import notify_topic_subscribers
-from pybb.models import Post, Topic, Profile, ReadTracking
+from pybb.models import Category, Forum, Post, Topic, Profile, ReadTracking, \
+                        Attachment
+from pybb.cache import bump_generation
+from pybb.page_cache import purge
+from pybb.user_search import update_user_ngrams
+from pybb.attachments import release_file
+from pybb.thumbnails import delete_thumbnails
+from pybb.last_topics import ORDERS, update_topic, update_list
+from pybb.search import index_post, unindex_post
+from pybb.util import gravatar_url
 
 
-def post_saved(instance, **kwargs):
-    notify_topic_subscribers(instance)
+def post_saved(instance, created, **kwargs):
+    if created:
+        notify_topic_subscribers(instance)
 
     profile = instance.user.pybb_profile
     profile.post_count = instance.user.pybb_posts.count()
     profile.save()
 
+    if settings.PYBB_SEARCH_ENABLE:
+        index_post(instance)
+
+
+def post_deleting(instance, **kwargs):
+    if settings.PYBB_SEARCH_ENABLE:
+        unindex_post(instance)
+
 
 def topic_saved(instance, **kwargs):
     forum = instance.forum
     forum.topic_count = forum.topics.count()
     forum.save()
+    old_forum_id = instance._pybb_forum_id
+    if old_forum_id is not None and old_forum_id != instance.forum_id:
+        # the topic is moved to another forum
+        for order in ORDERS:
+            update_list('forum:%s' % old_forum_id, order, instance, deleted=True)
+    update_topic(instance)
+    instance._pybb_forum_id = instance.forum_id
+
+
+def topic_loaded(instance, **kwargs):
+    # remember the loaded forum to remove moved topics from its lists
+    instance._pybb_forum_id = instance.forum_id
+
+
+def topic_deleted(instance, **kwargs):
+    update_topic(instance, deleted=True)
+
+
+def user_loaded(instance, **kwargs):
+    # remember loaded values to detect their changes in user_saved
+    instance._pybb_username = instance.username
+    instance._pybb_email = instance.email
 
 
 def user_saved(instance, created, **kwargs):
+    avatar_url = ''
+    if created or instance.email != instance._pybb_email:
+        try:
+            avatar_url = gravatar_url(instance.email)
+        except Site.DoesNotExist:
+            # the site is not created yet, e.g. superuser is created by syncdb
+            pass
     if created:
-        Profile.objects.create(user=instance)
+        Profile.objects.create(user=instance, avatar_url=avatar_url)
         ReadTracking.objects.create(user=instance)
+        bump_generation('users')
+    elif avatar_url:
+        Profile.objects.filter(user=instance).update(avatar_url=avatar_url)
+    renamed = instance.username != instance._pybb_username
+    if settings.PYBB_USER_SEARCH_NGRAMS and (created or renamed):
+        update_user_ngrams(instance)
+    instance._pybb_username = instance.username
+    instance._pybb_email = instance.email
+
+
+def attachment_deleted(instance, **kwargs):
+    release_file(instance.path)
+    delete_thumbnails(instance)
+
+
+def user_deleted(instance, **kwargs):
+    bump_generation('users')
+
+
+def content_changed(instance, **kwargs):
+    """
+    Purge cached data which depend on the saved or deleted object.
+    """
+
+    tags = ['forum_tree']
+    if isinstance(instance, Attachment):
+        for topic_id, forum_id in Topic.objects.filter(posts=instance.post_id)\
+                                       .values_list('pk', 'forum'):
+            tags += ['topic:%s' % topic_id, 'forum:%s' % forum_id]
+    elif isinstance(instance, Post):
+        tags.append('topic:%s' % instance.topic_id)
+        try:
+            tags.append('forum:%s' % instance.topic.forum_id)
+        except Topic.DoesNotExist:
+            # the post is deleted with its topic,
+            # the forum is purged on deletion of the topic
+            pass
+    elif isinstance(instance, Topic):
+        tags += ['topic:%s' % instance.pk, 'forum:%s' % instance.forum_id]
+    elif isinstance(instance, Forum):
+        tags.append('forum:%s' % instance.pk)
+    purge(tags)
 
 
 post_save.connect(post_saved, sender=Post)
+pre_delete.connect(post_deleting, sender=Post)
+post_init.connect(topic_loaded, sender=Topic)
 post_save.connect(topic_saved, sender=Topic)
+post_delete.connect(topic_deleted, sender=Topic)
+post_init.connect(user_loaded, sender=User)
 post_save.connect(user_saved, sender=User)
+post_delete.connect(user_deleted, sender=User)
+post_delete.connect(attachment_deleted, sender=Attachment)
+
+for model in (Category, Forum, Topic, Post, Attachment):
+    post_save.connect(content_changed, sender=model)
+    post_delete.connect(content_changed, sender=model)
@@ -10,3 +10,45 @@ function pybb_delete_post(url, post_id, confirm_text){
             }
     $.ajax(obj);
 }
+
+function pybb_pad(value){
+    return value < 10 ? '0' + value : '' + value;
+}
+
+function pybb_format_time(date, now, messages){
+    var delta = Math.floor((now - date) / 1000);
+    var hm = pybb_pad(date.getHours()) + ':' + pybb_pad(date.getMinutes());
+    var today = new Date(now.getFullYear(), now.getMonth(), now.getDate());
+    var yesterday = new Date(today - 24 * 3600 * 1000);
+
+    /* seconds and minutes hold translated messages for each number */
+    if (delta >= 0 && delta < 60)
+        return messages.seconds[delta];
+    if (delta >= 0 && delta < 3600)
+        return messages.minutes[Math.floor(delta / 60)];
+    if (date >= today && delta >= 0)
+        return messages.today.replace('%s', hm);
+    if (date >= yesterday && date < today)
+        return messages.yesterday.replace('%s', hm);
+    return pybb_pad(date.getDate()) + ' ' + messages.months[date.getMonth()] +
+           ', ' + date.getFullYear() + ' ' + hm;
+}
+
+function pybb_format_times(){
+    /* Convert UTC times rendered with PYBB_CLIENT_TIME option into
+       relative form in the time zone of the browser */
+    if (typeof pybb_time_messages == 'undefined') return;
+    var now = new Date();
+    $('time.pybb-time').each(function(){
+        var parts = $(this).attr('datetime').match(/^(\d+)-(\d+)-(\d+)T(\d+):(\d+):(\d+)Z$/);
+        if (!parts) return;
+        var date = new Date(Date.UTC(parts[1], parts[2] - 1, parts[3],
+                                     parts[4], parts[5], parts[6]));
+        $(this).text(pybb_format_time(date, now, pybb_time_messages));
+    });
+}
+
+$(function(){
+    pybb_format_times();
+    setInterval(pybb_format_times, 60 * 1000);
+});
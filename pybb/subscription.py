@@ -1,9 +1,18 @@
+from datetime import datetime, timedelta
+
 from django.conf import settings
 from django.core.urlresolvers import reverse
-from django.utils.translation import ugettext as _
+from django.utils.translation import ugettext as _, ungettext
 from django.utils import translation
+from django.core.mail import EmailMessage, get_connection
 from django.contrib.sites.models import Site
-from django.core.mail import send_mail
+from django.db import connection, transaction, IntegrityError
+from django.db.models import F
+
+from pybb.models import Topic, Profile, Notification, Digest, \
+                        SubscriptionState, NOTIFY_IMMEDIATELY, NOTIFY_HOURLY, \
+                        NOTIFY_DAILY
+from pybb.util import bulk_insert
 
 
 TOPIC_SUBSCRIPTION_TEXT_TEMPLATE = lambda: _(u"""New reply from %(username)s to topic that you have subscribed on.
@@ -13,30 +22,397 @@ TOPIC_SUBSCRIPTION_TEXT_TEMPLATE = lambda: _(u"""New reply from %(username)s to
 See topic: %(post_url)s
 Unsubscribe %(unsubscribe_url)s""")
 
+DIGEST_TEXT_TEMPLATE = lambda: _(u"""New replies to topics that you have subscribed on.
+---
+%(topics)s
+---
+Change subscription settings: %(profile_url)s""")
+
+DIGEST_TOPIC_TEMPLATE = lambda count: ungettext(u"""%(name)s: %(count)d new post
+%(url)s""", u"""%(name)s: %(count)d new posts
+%(url)s""", count)
+
+# number of users in one IN clause
+CHUNK_SIZE = 500
+
+DIGEST_PERIODS = {
+    NOTIFY_HOURLY: timedelta(hours=1),
+    NOTIFY_DAILY: timedelta(days=1),
+}
+
 
 def notify_topic_subscribers(post):
-    from pybb.models import Post
+    """
+    Put notifications about new post into the outbox.
+
+    With `PYBB_NOTIFY_UNTIL_VISITED` option enabled subscribers receiving
+    immediate notifications are not notified again until they visit the topic.
+
+    Notifications are delivered by `pybb_send_notifications` command, which
+    also merges notifications of users who prefer digests into their digests.
+    Digests are delivered by `pybb_send_digests` command.
+    """
 
     topic = post.topic
     if post != topic.head:
-        for user in topic.subscribers.all():
-            if user != post.user:
-                old_lang = translation.get_language()
-                lang = user.pybb_profile.language or 'en'
-                translation.activate(lang)
-
-                subject = u'RE: %s' % topic.name
-                to_email = user.email
-                hostname = Site.objects.get_current().domain
-                delete_url = reverse('pybb_subscription_delete', args=[post.topic.id])
-
-                content = TOPIC_SUBSCRIPTION_TEXT_TEMPLATE() % {
-                    'username': post.user.username,
-                    'message': post.body_text,
-                    'post_url': 'http://%s%s' % (hostname, post.get_absolute_url()),
-                    'unsubscribe_url': 'http://%s%s' % (hostname, delete_url),
-                }
-
-                send_mail(subject, content, settings.DEFAULT_FROM_EMAIL,
-                          [to_email], fail_silently=True)
-                translation.activate(old_lang)
+        subscribers = topic.subscribers.exclude(pk=post.user_id)\
+                           .values_list('pk', flat=True)
+        modes = dict(Profile.objects.filter(user__subscriptions=topic)
+                     .exclude(notification_mode=NOTIFY_IMMEDIATELY)
+                     .values_list('user', 'notification_mode'))
+        user_ids = []
+        digest_ids = []
+        for user_id in subscribers:
+            if modes.get(user_id) in DIGEST_PERIODS:
+                digest_ids.append(user_id)
+            else:
+                user_ids.append(user_id)
+        if settings.PYBB_NOTIFY_UNTIL_VISITED:
+            user_ids = filter_visited(post, user_ids)
+        enqueue_notifications(post, user_ids + digest_ids)
+
+
+def enqueue_notifications(post, user_ids):
+    """
+    Insert outbox items for given users with one executemany call.
+    """
+
+    now = connection.ops.value_to_db_datetime(datetime.now())
+    rows = [(user_id, post.pk, now, 0, now, '') for user_id in user_ids]
+    bulk_insert(Notification, ('user_id', 'post_id', 'created', 'attempts',
+                               'next_attempt', 'error'), rows)
+
+
+def filter_visited(post, user_ids):
+    """
+    Return pks of users which should be notified about the post.
+
+    The user is notified if there is no subscription state of the topic.
+    The state is inserted with the notification and deleted when the user
+    reads the topic (see ``update_read_tracking``), so the check is one
+    query by the topic. States of returned users are inserted.
+    """
+
+    notified = set(SubscriptionState.objects.filter(topic=post.topic_id)
+                   .values_list('user', flat=True))
+    result = [x for x in user_ids if x not in notified]
+    rows = [(x, post.topic_id, post.pk) for x in result]
+    sid = transaction.savepoint()
+    try:
+        bulk_insert(SubscriptionState, ('user_id', 'topic_id', 'post_id'), rows)
+    except IntegrityError:
+        # some states were inserted by concurrent post of the topic,
+        # their users are notified about that post
+        transaction.savepoint_rollback(sid)
+        result = [x for x in result if SubscriptionState.objects.get_or_create(
+                  user_id=x, topic_id=post.topic_id, defaults={'post': post})[1]]
+    else:
+        transaction.savepoint_commit(sid)
+    return result
+
+
+def merge_topics(topics, other):
+    """
+    Merge `topic pk` --> `[first new post pk, number of new posts]` mappings.
+    """
+
+    topics = dict(topics or {})
+    for key, (post_id, count) in other.items():
+        if key in topics:
+            topics[key] = [min(topics[key][0], post_id), topics[key][1] + count]
+        else:
+            topics[key] = [post_id, count]
+    return topics
+
+
+def merge_digest(user_id, topics, due, attempts=0, error=''):
+    """
+    Merge topics into the digest of the user, create missing digest.
+
+    `due`, `attempts` and `error` are set only if the digest is created or
+    was given up. The row is updated only if its version is not changed since
+    it was loaded, otherwise the merge is repeated, so concurrent workers
+    never overwrite each other and never restore the digest claimed
+    by `send_digests`.
+    """
+
+    while True:
+        try:
+            digest = Digest.objects.get(user=user_id)
+        except Digest.DoesNotExist:
+            # get_or_create handles the digest created by another worker
+            created = Digest.objects.get_or_create(user_id=user_id, defaults={
+                'topics': topics, 'due': due, 'attempts': attempts,
+                'error': error})[1]
+            if created:
+                return
+            continue
+
+        values = {'topics': merge_topics(digest.topics, topics),
+                  'version': F('version') + 1}
+        if digest.due is None:
+            values.update(due=due, attempts=attempts, error=error)
+        if Digest.objects.filter(pk=digest.pk, version=digest.version)\
+                         .update(**values):
+            return
+
+
+def add_to_digests(items, modes):
+    """
+    Merge outbox items into digests of their users.
+
+    Args:
+        items: list of ``Notification`` instances
+        modes: mapping of user pk to the notification mode
+    """
+
+    now = datetime.now()
+    topics = {}
+    for item in items:
+        key = str(item.post.topic_id)
+        merge = {key: [item.post_id, 1]}
+        topics[item.user_id] = merge_topics(topics.get(item.user_id), merge)
+
+    for user_id, user_topics in topics.iteritems():
+        merge_digest(user_id, user_topics,
+                     now + DIGEST_PERIODS[modes[user_id]])
+
+
+def get_languages(user_ids):
+    """
+    Return mapping of user pk to the language of notifications.
+    """
+
+    languages = dict(Profile.objects.filter(user__in=user_ids)
+                     .values_list('user', 'language'))
+    return dict((x, languages.get(x) or 'en') for x in user_ids)
+
+
+def render_notification(post, hostname):
+    """
+    Return subject and text of notification about the post
+    in the current language.
+    """
+
+    subject = u'RE: %s' % post.topic.name
+    delete_url = reverse('pybb_subscription_delete', args=[post.topic_id])
+    content = TOPIC_SUBSCRIPTION_TEXT_TEMPLATE() % {
+        'username': post.user.username,
+        'message': post.body_text,
+        'post_url': 'http://%s%s' % (hostname, post.get_absolute_url()),
+        'unsubscribe_url': 'http://%s%s' % (hostname, delete_url),
+    }
+    return subject, content
+
+
+def build_messages(notifications):
+    """
+    Build email messages for outbox items.
+
+    Text of message is rendered once per post and language of recipients.
+    Return list of (outbox item, message) pairs.
+    """
+
+    languages = get_languages([x.user_id for x in notifications])
+    hostname = Site.objects.get_current().domain
+
+    groups = {}
+    for item in notifications:
+        lang = languages[item.user_id]
+        groups.setdefault((item.post_id, lang), []).append(item)
+
+    messages = []
+    old_lang = translation.get_language()
+    try:
+        for (post_id, lang), items in groups.iteritems():
+            translation.activate(lang)
+            subject, content = render_notification(items[0].post, hostname)
+            for item in items:
+                message = EmailMessage(subject, content,
+                                       settings.DEFAULT_FROM_EMAIL,
+                                       [item.user.email])
+                messages.append((item, message))
+    finally:
+        translation.activate(old_lang)
+    return messages
+
+
+def retry_time(attempts):
+    """
+    Return time of the next delivery attempt with exponential backoff.
+
+    Return None if the delivery is given up after `attempts` failures.
+    """
+
+    if attempts >= settings.PYBB_NOTIFICATION_MAX_ATTEMPTS:
+        return None
+    delay = settings.PYBB_NOTIFICATION_RETRY_DELAY * 2 ** (attempts - 1)
+    return datetime.now() + timedelta(seconds=delay)
+
+
+def reschedule(item, error):
+    """
+    Postpone delivery of failed outbox item.
+    """
+
+    item.attempts += 1
+    item.error = unicode(error)
+    item.next_attempt = retry_time(item.attempts)
+    item.save()
+
+
+def claim_digest(digest):
+    """
+    Delete the digest if it is not changed since it was loaded.
+
+    Return True if the digest is deleted, so this worker sends it.
+    """
+
+    qn = connection.ops.quote_name
+    cursor = connection.cursor()
+    cursor.execute('DELETE FROM %s WHERE %s = %%s AND %s = %%s' % (
+        qn(Digest._meta.db_table), qn('id'), qn('version')),
+        [digest.pk, digest.version])
+    transaction.commit_unless_managed()
+    return cursor.rowcount == 1
+
+
+def deliver(messages):
+    """
+    Send messages through one email connection.
+
+    Messages are sent one by one over the open connection, so the failure
+    of one message does not cause other messages to be sent again.
+    `messages` is a list of (item, message) pairs.
+    Return list of sent items and list of (item, error) pairs of failed items.
+    """
+
+    mail_connection = get_connection()
+    try:
+        mail_connection.open()
+    except Exception, ex:
+        return [], [(x[0], ex) for x in messages]
+
+    sent = []
+    failed = []
+    try:
+        for item, message in messages:
+            try:
+                mail_connection.send_messages([message])
+            except Exception, ex:
+                failed.append((item, ex))
+            else:
+                sent.append(item)
+    finally:
+        mail_connection.close()
+    return sent, failed
+
+
+def send_notifications(batch_size=None):
+    """
+    Deliver one batch of due outbox items.
+
+    Return tuple of numbers of sent and failed items.
+    """
+
+    batch_size = batch_size or settings.PYBB_NOTIFICATION_BATCH_SIZE
+    items = list(Notification.objects.filter(next_attempt__lte=datetime.now())
+                 .select_related('user', 'post__topic', 'post__user')
+                 .order_by('next_attempt')[:batch_size])
+    if not items:
+        return 0, 0
+
+    modes = dict(Profile.objects.filter(user__in=[x.user_id for x in items])
+                 .values_list('user', 'notification_mode'))
+    digest_items = [x for x in items if modes.get(x.user_id) in DIGEST_PERIODS]
+    items = [x for x in items if modes.get(x.user_id) not in DIGEST_PERIODS]
+    if digest_items:
+        add_to_digests(digest_items, modes)
+
+    sent, failed = deliver(build_messages(items))
+    for item, error in failed:
+        reschedule(item, error)
+    sent += digest_items
+    Notification.objects.filter(pk__in=[x.pk for x in sent]).delete()
+    return len(sent), len(failed)
+
+
+def render_digest(digest, topics, hostname):
+    """
+    Return subject and text of the digest in the current language.
+
+    Return None if all topics of the digest were deleted.
+    """
+
+    chunks = []
+    for topic_id, (post_id, count) in sorted(digest.topics.items()):
+        topic = topics.get(int(topic_id))
+        if topic is None:
+            continue
+        post_url = reverse('pybb_post_details', args=[post_id])
+        chunks.append(DIGEST_TOPIC_TEMPLATE(count) % {
+            'name': topic.name,
+            'count': count,
+            'url': 'http://%s%s' % (hostname, post_url),
+        })
+    if not chunks:
+        return None
+
+    subject = _(u'New replies in subscribed topics')
+    content = DIGEST_TEXT_TEMPLATE() % {
+        'topics': u'\n\n'.join(chunks),
+        'profile_url': 'http://%s%s' % (hostname, reverse('pybb_profile_edit')),
+    }
+    return subject, content
+
+
+def send_digests(batch_size=None):
+    """
+    Deliver one batch of due digests, one message per user.
+
+    Return tuple of numbers of processed and failed digests. Digests
+    of deleted topics are counted as processed but are not sent.
+
+    Each digest is claimed by deleting it before sending, new posts are
+    collected into a new digest meanwhile. Topics of failed digests are
+    merged back.
+    """
+
+    batch_size = batch_size or settings.PYBB_NOTIFICATION_BATCH_SIZE
+    digests = list(Digest.objects.filter(due__lte=datetime.now())
+                   .select_related('user').order_by('due')[:batch_size])
+    if not digests:
+        return 0, 0
+    # digests changed or claimed by other workers are skipped
+    digests = [x for x in digests if claim_digest(x)]
+
+    topic_ids = set()
+    for digest in digests:
+        topic_ids.update(int(x) for x in (digest.topics or {}))
+    topics = Topic.objects.in_bulk(list(topic_ids))
+    languages = get_languages([x.user_id for x in digests])
+    hostname = Site.objects.get_current().domain
+
+    messages = []
+    empty = []
+    old_lang = translation.get_language()
+    try:
+        for digest in sorted(digests, key=lambda x: languages[x.user_id]):
+            translation.activate(languages[digest.user_id])
+            text = digest.topics and render_digest(digest, topics, hostname)
+            if text:
+                message = EmailMessage(text[0], text[1],
+                                       settings.DEFAULT_FROM_EMAIL,
+                                       [digest.user.email])
+                messages.append((digest, message))
+            else:
+                empty.append(digest)
+    finally:
+        translation.activate(old_lang)
+
+    sent, failed = deliver(messages)
+    for digest, error in failed:
+        attempts = digest.attempts + 1
+        merge_digest(digest.user_id, digest.topics, retry_time(attempts),
+                     attempts, unicode(error))
+    return len(sent) + len(empty), len(failed)
@@ -20,9 +20,14 @@ from django.utils import dateformat
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.utils.translation import ungettext
+from django.utils import simplejson
 
 from pybb.models import Forum, Topic, Post
 from pybb.util import gravatar_url
+from pybb.read_tracking import ReadMap
+from pybb.pagination import mini_pagination
+from pybb.last_topics import get_last_topics, ORDERS
+from pybb.permissions import is_moderator, can_edit_post, get_profile
 
 
 register = template.Library()
@@ -62,6 +67,8 @@ class PybbTimeNode(template.Node):
 
     def render(self, context):
         context_time = self.time.resolve(context)
+        if settings.PYBB_CLIENT_TIME:
+            return render_client_time(context_time)
 
         delta = datetime.now() - context_time
         today = datetime.now().replace(hour=0, minute=0, second=0)
@@ -90,7 +97,7 @@ class PybbTimeNode(template.Node):
                 tz1 = time.altzone
             else:
                 tz1 = time.timezone
-            tz = tz1 + context['user'].pybb_profile.time_zone * 60 * 60
+            tz = tz1 + get_profile(context['user']).time_zone * 60 * 60
             context_time = context_time + timedelta(seconds=tz)
         if today < context_time < tomorrow:
             return _('today, %s') % context_time.strftime('%H:%M')
@@ -100,13 +107,50 @@ class PybbTimeNode(template.Node):
             return dateformat.format(context_time, 'd M, Y H:i')
 
 
+def render_client_time(value):
+    """
+    Render the time which does not depend on the viewer.
+
+    The time is rendered in UTC, ``pybb_format_times`` function from
+    pybbjs.js converts it into relative form in the time zone of
+    the browser.
+    """
+
+    utc = datetime.utcfromtimestamp(time.mktime(value.timetuple()))
+    return mark_safe(u'<time class="pybb-time" datetime="%s">%s UTC</time>' % (
+        utc.strftime('%Y-%m-%dT%H:%M:%SZ'), dateformat.format(utc, 'd M, Y H:i')))
+
+
+@register.simple_tag
+def pybb_time_messages():
+    """
+    Render translated messages used by ``pybb_format_times`` function.
+
+    Relative times are rendered for each number of seconds and minutes below
+    the minute and the hour, so plural forms follow the rules of the
+    language catalog.
+    """
+
+    messages = {
+        'seconds': [ungettext('%d second ago', '%d seconds ago', x) % x
+                    for x in range(60)],
+        'minutes': [ungettext('%d minute ago', '%d minutes ago', x) % x
+                    for x in range(60)],
+        'today': _('today, %s'),
+        'yesterday': _('yesterday, %s'),
+        'months': [dateformat.format(datetime(2000, x, 1), 'M') for x in range(1, 13)],
+    }
+    return u'<script type="text/javascript">var pybb_time_messages = %s;</script>' % \
+           simplejson.dumps(messages)
+
+
 @register.filter
 def pybb_moderated_by(topic, user):
     """
     Check if user is moderator of topic's forum.
     """
 
-    return user.is_superuser or user in topic.forum.moderators.all()
+    return is_moderator(user, topic.forum_id)
 
 
 @register.filter
@@ -115,13 +159,7 @@ def pybb_editable_by(post, user):
     Check if the post could be edited by the user.
     """
 
-    if user.is_superuser:
-        return True
-    if post.user == user:
-        return True
-    if user in post.topic.forum.moderators.all():
-        return True
-    return False
+    return can_edit_post(user, post)
 
 
 @register.filter
@@ -146,32 +184,22 @@ def pybb_equal_to(obj1, obj2):
 def pybb_topic_mini_pagination(topic):
     """
     Display links on topic pages.
-    """
 
-    is_paginated = topic.post_count > settings.PYBB_TOPIC_PAGE_SIZE
-    if not is_paginated:
-        pagination = None
-    else:
-        page_size = settings.PYBB_TOPIC_PAGE_SIZE
-        template =  u'<a href="%s?page=%%(p)s">%%(p)s</a>' % topic.get_absolute_url()
-        page_count =  ((topic.post_count - 1) / page_size ) + 1
-        if page_count > 4:
-            pages = [1, 2, page_count - 1, page_count]
-            links = [template % {'p': page} for page in pages]
-            pagination = u"%s, %s ... %s, %s" % tuple(links)
-        else:
-            pages = range(1,page_count+1)
-            links = [template % {'p': page} for page in pages]
-            pagination = u", ".join(links)
+    Links loaded with ``load_mini_pagination`` are used if available.
+    """
 
-    return {'pagination': pagination,
-            'is_paginated': is_paginated,
+    try:
+        pagination = topic.mini_pagination
+    except AttributeError:
+        pagination = mini_pagination(topic)
+    return {'pagination': pagination or None,
+            'is_paginated': bool(pagination),
             }
 
 
 @register.filter
 def pybb_avatar_url(user):
-    return gravatar_url(user.email)
+    return user.pybb_profile.avatar_url or gravatar_url(user.email)
 
 
 @register.tag(name='pybb_load_last_topics')
@@ -187,10 +215,14 @@ def do_pybb_load_last_topics(parser, token):
         {% pybb_load_last_topics as last_topics with forum=forum.pk,order_by="updated" %}
 
     Available arguments for with clause:
-        limit: limitation of number of loaded items
+        limit: limitation of number of loaded items, at most
+            PYBB_LAST_TOPICS_SIZE
         category: primary key of category to load topics from
         forum: primary key of forum to load topics from
-        order_by: the Topic field name to order the topic selection with. Default is "created"
+        order_by: "created" or "updated", the Topic field to order the
+            topic selection with. Default is "created"
+
+    Topics are read from lists cached in ``pybb.last_topics``.
     """
 
     try:
@@ -205,6 +237,7 @@ def do_pybb_load_last_topics(parser, token):
 
     limit = '10'
     category = '0'
+    forum = '0'
     order_by='"created"'
 
     if match.group(2):
@@ -213,27 +246,31 @@ def do_pybb_load_last_topics(parser, token):
             limit = args['limit']
         if 'category' in args:
             category = args['category']
+        if 'forum' in args:
+            forum = args['forum']
         if 'order_by' in args:
             order_by = args['order_by']
 
-    return PybbLoadLastTopicsNode(name, limit, category, order_by)
+    return PybbLoadLastTopicsNode(name, limit, category, forum, order_by)
 
 
 class PybbLoadLastTopicsNode(template.Node):
-    def __init__(self, name, limit, category, order_by):
+    def __init__(self, name, limit, category, forum, order_by):
         self.name = name
         self.limit = template.Variable(limit)
         self.category = template.Variable(category)
+        self.forum = template.Variable(forum)
         self.order_by = template.Variable(order_by)
 
     def render(self, context):
-        limit = self.limit.resolve(context)
+        limit = int(self.limit.resolve(context))
         category = self.category.resolve(context)
+        forum = self.forum.resolve(context)
         order_by = self.order_by.resolve(context)
-        topics = Topic.objects.all().select_related().order_by('-' + order_by)
-        if category:
-            topics = topics.filter(forum__category__pk=category)
-        context[self.name] = topics[:limit]
+        if order_by not in ORDERS:
+            raise template.TemplateSyntaxError('order_by should be one of: %s' % ', '.join(ORDERS))
+        context[self.name] = get_last_topics(limit, category=category,
+                                             forum=forum, order=order_by)
         return ''
 
 
@@ -292,11 +329,7 @@ def pybb_topic_unread(topic, user):
                                               topic.last_post.created):
         return False
 
-    if isinstance(track.topics, dict):
-        post_pk = track.topics.get(str(topic.pk), 0)
-        return topic.last_post.pk > post_pk
-
-    return True
+    return topic.last_post.pk > ReadMap(track.topics).get(topic.pk)
 
 
 @register.filter
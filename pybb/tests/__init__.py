@@ -4,9 +4,46 @@ The root of pybb tests.
 import unittest
 
 from pybb.tests.postmarkup import PostmarkupTestCase
+from pybb.tests.read_tracking import ReadMapTestCase
+from pybb.tests.subscription import SubscriptionTestCase
+from pybb.tests.cache import ForumTreeCacheTestCase, LastTopicsTestCase
+from pybb.tests.pagination import KeysetPaginationTestCase, \
+                                  PositionPaginationTestCase
+from pybb.tests.permissions import PermissionsTestCase
+from pybb.tests.conditional import ConditionalGetTestCase
+from pybb.tests.page_cache import PageCacheTestCase, FeedCacheTestCase
+from pybb.tests.indexes import QueryPlanTestCase
+from pybb.tests.api import ApiTestCase
+from pybb.tests.user_search import UserSearchTestCase
+from pybb.tests.avatar import AvatarTestCase
+from pybb.tests.search import SearchTestCase
+from pybb.tests.middleware import LanguageMiddlewareTestCase
+from pybb.tests.templatetags import TimeTagTestCase, MiniPaginationTestCase
+from pybb.tests.attachments import AttachmentStorageTestCase, \
+                                   AttachmentDeliveryTestCase
 
 def suite():
     cases = (PostmarkupTestCase,
+             ReadMapTestCase,
+             SubscriptionTestCase,
+             ForumTreeCacheTestCase,
+             LastTopicsTestCase,
+             KeysetPaginationTestCase,
+             PositionPaginationTestCase,
+             PermissionsTestCase,
+             ConditionalGetTestCase,
+             PageCacheTestCase,
+             FeedCacheTestCase,
+             QueryPlanTestCase,
+             ApiTestCase,
+             UserSearchTestCase,
+             SearchTestCase,
+             AttachmentStorageTestCase,
+             AttachmentDeliveryTestCase,
+             AvatarTestCase,
+             TimeTagTestCase,
+             LanguageMiddlewareTestCase,
+             MiniPaginationTestCase,
             )
     tests = unittest.TestSuite(
         unittest.TestLoader().loadTestsFromTestCase(x)\
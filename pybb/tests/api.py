@@ -0,0 +1,65 @@
+from django.test import TestCase
+from django.http import HttpRequest, QueryDict
+from django.utils import simplejson
+from django.contrib.auth.models import User, AnonymousUser
+
+from pybb.models import Category, Forum, Topic, Post
+from pybb import api
+
+
+class ApiTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('user', 'user@example.com', 'pass')
+        category = Category.objects.create(name='category')
+        self.forum = Forum.objects.create(category=category, name='forum')
+        self.topic = Topic.objects.create(forum=self.forum, user=self.user, name='topic')
+        for x in range(5):
+            Post.objects.create(topic=self.topic, user=self.user, body='post %d' % x)
+
+    def get(self, view, query_string, *args):
+        request = HttpRequest()
+        request.method = 'GET'
+        request.user = AnonymousUser()
+        request.META['QUERY_STRING'] = query_string
+        request.GET = QueryDict(query_string)
+        response = view(request, *args)
+        return response.status_code, simplejson.loads(response.content)
+
+    def testFieldsAndCursor(self):
+        status, data = self.get(api.post_list, 'fields=id,username,position&limit=2',
+                                str(self.topic.pk))
+        self.assertEqual(status, 200)
+        self.assertEqual(data['objects'][0], {'id': self.topic.head.pk,
+                                              'username': 'user', 'position': 1})
+        positions = [x['position'] for x in data['objects']]
+        while data['next']:
+            status, data = self.get(api.post_list, 'fields=position&limit=2&after=%s' % data['next'],
+                                    str(self.topic.pk))
+            positions += [x['position'] for x in data['objects']]
+        self.assertEqual(positions, [1, 2, 3, 4, 5])
+
+    def testTopicWithoutPosts(self):
+        empty = Topic.objects.create(forum=self.forum, user=self.user, name='empty')
+        status, data = self.get(api.topic_list, 'fields=id&limit=1', str(self.forum.pk))
+        self.assertEqual(status, 200)
+        self.assertEqual(data['objects'], [{'id': empty.pk}])
+        status, data = self.get(api.topic_list, 'fields=id&limit=1&after=%s' % data['next'],
+                                str(self.forum.pk))
+        self.assertEqual(status, 200)
+        self.assertEqual(data['objects'], [{'id': self.topic.pk}])
+
+    def testProjection(self):
+        resource = api.PostResource(Post.objects.all())
+        qs = api.project(resource.qs, ['id', 'position', 'user__username'])
+        post = qs[0]
+        self.assertEqual(post.user.username, 'user')
+        self.assertTrue(post._deferred)
+        self.assertFalse('body_html' in post.__dict__)
+
+    def testErrors(self):
+        status, data = self.get(api.topic_list, 'fields=id,user_ip', str(self.forum.pk))
+        self.assertEqual(status, 400)
+        status, data = self.get(api.topic_list, '', '0')
+        self.assertEqual(status, 404)
+        status, data = self.get(api.topic_list, 'after=bad', str(self.forum.pk))
+        self.assertEqual(status, 400)
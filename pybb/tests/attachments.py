@@ -0,0 +1,174 @@
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase
+from django.http import HttpRequest
+from django.conf import settings
+from django.contrib.auth.models import User, AnonymousUser
+
+from pybb.models import Category, Forum, Topic, Post, Attachment
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+from pybb.attachments import serve_python, store_file, attach_file
+from pybb import thumbnails
+from pybb.views import attachment_thumbnail
+
+
+class AttachmentStorageTestCase(TestCase):
+    def setUp(self):
+        self.old_media_root = settings.MEDIA_ROOT
+        settings.MEDIA_ROOT = tempfile.mkdtemp()
+        user = User.objects.create_user('user', 'user@example.com', 'pass')
+        category = Category.objects.create(name='category')
+        forum = Forum.objects.create(category=category, name='forum')
+        topic = Topic.objects.create(forum=forum, user=user, name='topic')
+        self.post = Post.objects.create(topic=topic, user=user, body='head')
+
+    def tearDown(self):
+        shutil.rmtree(settings.MEDIA_ROOT)
+        settings.MEDIA_ROOT = self.old_media_root
+
+    def attach(self, data):
+        upload = SimpleUploadedFile('file.txt', data)
+        attachment = Attachment(post=self.post, size=upload.size, name=upload.name,
+                                content_type='text/plain', path=store_file(upload))
+        attachment.save()
+        return attachment
+
+    def testDeduplication(self):
+        first = self.attach('content')
+        second = self.attach('content')
+        other = self.attach('other content')
+        self.assertEqual(first.path, second.path)
+        self.assertNotEqual(first.path, other.path)
+        self.assertEqual(open(first.get_absolute_path()).read(), 'content')
+        self.assertEqual(len(os.listdir(os.path.dirname(first.get_absolute_path()))), 1)
+
+        # the file is deleted with the last attachment
+        first.delete()
+        self.assertTrue(os.path.exists(second.get_absolute_path()))
+        second.delete()
+        self.assertFalse(os.path.exists(second.get_absolute_path()))
+        self.assertTrue(os.path.exists(other.get_absolute_path()))
+
+    def request(self):
+        request = HttpRequest()
+        request.method = 'GET'
+        request.user = self.post.user
+        return request
+
+    def testBrokenImage(self):
+        attachment = self.attach('not an image')
+        attachment.content_type = 'image/png'
+        attachment.save()
+        response = attachment_thumbnail(self.request(), attachment.hash, 'small')
+        self.assertEqual(response.status_code, 302)
+
+        request = self.request()
+        request.user = AnonymousUser()
+        request.path = '/'
+        response = attachment_thumbnail(request, attachment.hash, 'small')
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].startswith(settings.LOGIN_URL))
+
+    def testDeduplicatedFileIsTouched(self):
+        attachment = self.attach('content')
+        path = attachment.get_absolute_path()
+        os.utime(path, (0, 0))
+        self.attach('content')
+        self.assertTrue(os.path.getmtime(path) > 0)
+
+    def testAttachRestoresFile(self):
+        attachment = self.attach('content')
+        path = attachment.get_absolute_path()
+        upload = SimpleUploadedFile('file.txt', 'content')
+        other = Attachment(post=self.post, size=upload.size, name=upload.name,
+                           content_type='text/plain')
+        # the file is deleted by concurrent deletion of the attachment
+        # after the content was found in the storage
+        other.save = lambda: (os.remove(path), Attachment.save(other))
+        attach_file(other, upload)
+        self.assertEqual(attachment.path, other.path)
+        self.assertEqual('content', open(path, 'rb').read())
+
+    def testThumbnail(self):
+        attachment = self.attach('not an image')
+        self.assertEqual(thumbnails.get_thumbnail(attachment, 'small'), None)
+        if thumbnails.Image is None:
+            return
+
+        image = thumbnails.Image.new('RGB', (800, 400))
+        path = os.path.join(settings.MEDIA_ROOT, 'image.png')
+        image.save(path)
+        upload = SimpleUploadedFile('image.png', open(path, 'rb').read())
+        attachment = Attachment(post=self.post, size=upload.size, name=upload.name,
+                                content_type='image/png', path=store_file(upload))
+        attachment.save()
+
+        path = thumbnails.get_thumbnail(attachment, 'small')
+        self.assertEqual(thumbnails.Image.open(path).size, (200, 100))
+        response = attachment_thumbnail(self.request(), attachment.hash, 'small')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Cache-Control'].startswith('private,'))
+        attachment.delete()
+        self.assertFalse(os.path.exists(path))
+
+
+class AttachmentDeliveryTestCase(TestCase):
+    def setUp(self):
+        self.old_media_root = settings.MEDIA_ROOT
+        settings.MEDIA_ROOT = tempfile.mkdtemp()
+        user = User.objects.create_user('user', 'user@example.com', 'pass')
+        category = Category.objects.create(name='category')
+        forum = Forum.objects.create(category=category, name='forum')
+        topic = Topic.objects.create(forum=forum, user=user, name='topic')
+        post = Post.objects.create(topic=topic, user=user, body='head')
+
+        self.data = ''.join(chr(x % 256) for x in xrange(1000))
+        self.attachment = Attachment(
+            post=post, size=len(self.data), content_type='application/octet-stream',
+            path='data.bin', name='data.bin')
+        self.attachment.save()
+        path = self.attachment.get_absolute_path()
+        os.makedirs(os.path.dirname(path))
+        open(path, 'wb').write(self.data)
+
+    def tearDown(self):
+        shutil.rmtree(settings.MEDIA_ROOT)
+        settings.MEDIA_ROOT = self.old_media_root
+
+    def get(self, **headers):
+        request = HttpRequest()
+        request.method = 'GET'
+        request.META.update(headers)
+        return serve_python(request, self.attachment)
+
+    def testFullResponse(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Length'], '1000')
+        self.assertEqual(response['ETag'], '"%s"' % self.attachment.hash)
+        self.assertEqual(response.content, self.data)
+
+        response = self.get(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def testRange(self):
+        response = self.get(HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 100-199/1000')
+        self.assertEqual(response.content, self.data[100:200])
+
+        response = self.get(HTTP_RANGE='bytes=-10')
+        self.assertEqual(response.content, self.data[-10:])
+
+        response = self.get(HTTP_RANGE='bytes=2000-')
+        self.assertEqual(response.status_code, 416)
+
+        # the range is ignored if the file was changed
+        response = self.get(HTTP_RANGE='bytes=100-199', HTTP_IF_RANGE='"other"')
+        self.assertEqual(response.status_code, 200)
+        response = self.get(HTTP_RANGE='bytes=100-199',
+                            HTTP_IF_RANGE='"%s"' % self.attachment.hash)
+        self.assertEqual(response.status_code, 206)
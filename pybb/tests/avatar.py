@@ -0,0 +1,36 @@
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.contrib.sites.models import Site
+
+from pybb.models import Profile
+from pybb.util import gravatar_url
+from pybb.templatetags.pybb_tags import pybb_avatar_url
+
+
+class AvatarTestCase(TestCase):
+    def testAvatarUrl(self):
+        user = User.objects.create_user('user', 'user@example.com', 'pass')
+        profile = Profile.objects.get(user=user)
+        self.assertEqual(profile.avatar_url, gravatar_url('user@example.com'))
+
+        user.email = 'other@example.com'
+        user.save()
+        user = User.objects.select_related('pybb_profile').get(pk=user.pk)
+        self.assertEqual(pybb_avatar_url(user), gravatar_url('other@example.com'))
+
+    def testSiteDomain(self):
+        site = Site.objects.get_current()
+        site.domain = 'forum.example.com'
+        site.save()
+        self.assertTrue('forum.example.com' in gravatar_url('user@example.com'))
+        site.domain = 'example.com'
+        site.save()
+        self.assertFalse('forum.example.com' in gravatar_url('user@example.com'))
+
+    def testEmailNotChanged(self):
+        user = User.objects.create_user('user', 'user@example.com', 'pass')
+        Profile.objects.filter(user=user).update(avatar_url='')
+        user = User.objects.get(pk=user.pk)
+        user.first_name = 'First'
+        user.save()
+        self.assertEqual(Profile.objects.get(user=user).avatar_url, '')
@@ -0,0 +1,105 @@
+from django.test import TestCase
+from django.core.cache import cache
+from django.conf import settings
+from django.db import connection
+from django.contrib.auth.models import User
+
+from pybb.models import Category, Forum, Topic, Post
+from pybb.cache import get_forum_tree
+from pybb.last_topics import get_last_topics
+
+
+class ForumTreeCacheTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('user', 'user@example.com', 'pass')
+        self.category = Category.objects.create(name='category')
+        self.forum = Forum.objects.create(category=self.category, name='forum')
+
+    def testCachedTree(self):
+        tree = get_forum_tree()
+        self.assertEqual([self.forum.pk], [x.pk for x in tree[0].cached_forums])
+        Forum.objects.filter(pk=self.forum.pk).update(name='changed')
+        self.assertEqual('forum', get_forum_tree()[0].cached_forums[0].name)
+
+    def testInvalidation(self):
+        get_forum_tree()
+        topic = Topic.objects.create(forum=self.forum, user=self.user, name='topic')
+        post = Post.objects.create(topic=topic, user=self.user, body='body')
+        forum = get_forum_tree()[0].cached_forums[0]
+        self.assertEqual(post.pk, forum.last_post.pk)
+        self.assertEqual('user', forum.last_post.user.username)
+
+        Forum.objects.create(category=self.category, name='forum2')
+        self.assertEqual(2, len(get_forum_tree()[0].cached_forums))
+
+
+class LastTopicsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('user', 'user@example.com', 'pass')
+        self.category = Category.objects.create(name='category')
+        self.forum = Forum.objects.create(category=self.category, name='forum')
+        self.forum2 = Forum.objects.create(category=self.category, name='forum2')
+        self.old_size = settings.PYBB_LAST_TOPICS_SIZE
+        settings.PYBB_LAST_TOPICS_SIZE = 3
+
+    def tearDown(self):
+        settings.PYBB_LAST_TOPICS_SIZE = self.old_size
+
+    def create_topic(self, forum, name):
+        topic = Topic.objects.create(forum=forum, user=self.user, name=name)
+        Post.objects.create(topic=topic, user=self.user, body='body')
+        return Topic.objects.get(pk=topic.pk)
+
+    def count_queries(self, func):
+        old_debug = settings.DEBUG
+        settings.DEBUG = True
+        try:
+            count = len(connection.queries)
+            func()
+            return len(connection.queries) - count
+        finally:
+            settings.DEBUG = old_debug
+
+    def names(self, **kwargs):
+        return [x.name for x in get_last_topics(10, **kwargs)]
+
+    def testUpdates(self):
+        foo = self.create_topic(self.forum, 'foo')
+        bar = self.create_topic(self.forum2, 'bar')
+        self.assertEqual(['bar', 'foo'], self.names())
+
+        # new topics and posts are added to cached lists
+        baz = self.create_topic(self.forum, 'baz')
+        Post.objects.create(topic=foo, user=self.user, body='body')
+        self.assertEqual(['baz', 'bar', 'foo'], self.names())
+        self.assertEqual(['foo', 'baz', 'bar'], self.names(order='updated'))
+        self.assertEqual(['foo', 'baz'], self.names(forum=self.forum.pk, order='updated'))
+        self.assertEqual(['foo', 'baz', 'bar'],
+                         self.names(category=self.category.pk, order='updated'))
+
+        # lists are read without queries
+        self.assertEqual(0, self.count_queries(lambda: [
+            (x.user.username, x.forum.name, x.forum.category.name)
+            for x in get_last_topics(10)]))
+
+        # the full list is reloaded after deletion
+        self.create_topic(self.forum2, 'qux')
+        self.assertEqual(['qux', 'baz', 'bar'], self.names())
+        baz.delete()
+        self.assertEqual(['qux', 'bar', 'foo'], self.names())
+
+    def testMovedTopic(self):
+        foo = self.create_topic(self.forum, 'foo')
+        self.create_topic(self.forum, 'bar')
+        for i in range(3):
+            self.create_topic(self.forum2, 'baz%d' % i)
+        # foo is not in the list of the whole board any more
+        self.assertEqual(['bar', 'foo'], self.names(forum=self.forum.pk))
+        self.assertEqual(['baz2', 'baz1', 'baz0'], self.names(forum=self.forum2.pk))
+
+        foo.forum = self.forum2
+        foo.save()
+        self.assertEqual(['bar'], self.names(forum=self.forum.pk))
+        self.assertEqual(['bar'], self.names(forum=self.forum.pk, order='updated'))
+        self.assertEqual(['baz2', 'baz1', 'baz0'], self.names(forum=self.forum2.pk))
@@ -0,0 +1,64 @@
+from django.test import TestCase
+from django.http import HttpRequest, HttpResponse
+from django.contrib.auth.models import User, AnonymousUser
+
+from pybb.models import Category, Forum, Topic, Post
+from pybb.conditional import conditional, topic_state
+
+
+@conditional(topic_state)
+def topic_view(request, topic_id):
+    return HttpResponse('topic')
+
+
+class ConditionalGetTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('user', 'user@example.com', 'pass')
+        category = Category.objects.create(name='category')
+        forum = Forum.objects.create(category=category, name='forum')
+        self.topic = Topic.objects.create(forum=forum, user=self.user, name='topic')
+        self.head = Post.objects.create(topic=self.topic, user=self.user, body='head')
+
+    def get(self, user, **headers):
+        request = HttpRequest()
+        request.method = 'GET'
+        request.path = '/topic/%d/' % self.topic.pk
+        request.user = user
+        request.META.update(headers)
+        return topic_view(request, str(self.topic.pk))
+
+    def testNotModified(self):
+        response = self.get(AnonymousUser())
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.has_header('Last-Modified'))
+        etag = response['ETag']
+        response = self.get(AnonymousUser(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # new posts and edits change the validator
+        post = Post.objects.create(topic=self.topic, user=self.user, body='reply')
+        response = self.get(AnonymousUser(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        post.body = 'edited'
+        post.save()
+        response = self.get(AnonymousUser(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def testUserState(self):
+        etag = self.get(AnonymousUser())['ETag']
+        response = self.get(self.user, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Last-Modified'))
+
+        etag = response['ETag']
+        self.assertEqual(self.get(self.user, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.topic.subscribers.add(self.user)
+        self.assertEqual(self.get(self.user, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def testMissingTopic(self):
+        request = HttpRequest()
+        request.method = 'GET'
+        request.user = AnonymousUser()
+        response = topic_view(request, '0')
+        self.assertFalse(response.has_header('ETag'))
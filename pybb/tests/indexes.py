@@ -0,0 +1,77 @@
+from django.test import TestCase
+from django.conf import settings
+from django.db import connection, DEFAULT_DB_ALIAS
+
+from pybb.models import Topic, Post
+
+
+class QueryPlanTestCase(TestCase):
+    """
+    Check that hot queries use indexes created by migrations.
+
+    The test does not create objects because sqlite module commits
+    the transaction before EXPLAIN statement.
+    """
+
+    def explain(self, qs):
+        sql, params = qs.query.get_compiler(DEFAULT_DB_ALIAS).as_sql()
+        cursor = connection.cursor()
+        if self.engine == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        else:
+            cursor.execute('EXPLAIN ' + sql, params)
+        return ' '.join(' '.join(map(unicode, x)) for x in cursor.fetchall())
+
+    def assertIndexUsed(self, qs, table, columns):
+        plan = self.explain(qs)
+        name = self.db.create_index_name(table, columns)
+        self.assertTrue(name in plan, '%s is not used: %s' % (name, plan))
+
+    def testIndexes(self):
+        try:
+            from south.db import db
+        except ImportError:
+            # indexes are created by south migrations
+            return
+        if not getattr(settings, 'SOUTH_TESTS_MIGRATE', True):
+            # test database is created with syncdb, without the indexes
+            return
+        engine = connection.settings_dict['ENGINE']
+        if engine.endswith('sqlite3'):
+            self.engine = 'sqlite'
+        elif 'postgresql' in engine:
+            self.engine = 'postgresql'
+        else:
+            return
+        self.db = db
+
+        if self.engine == 'postgresql':
+            # tables of tests are too small to prefer indexes
+            connection.cursor().execute('SET enable_seqscan = off')
+        try:
+            self.checkIndexes()
+        finally:
+            if self.engine == 'postgresql':
+                connection.cursor().execute('RESET enable_seqscan')
+
+    def checkIndexes(self):
+        self.assertIndexUsed(
+            Topic.objects.filter(forum=1).order_by('-sticky', '-updated', '-id')[:20],
+            'pybb_topic', ['forum_id', 'sticky', 'updated', 'id'])
+        self.assertIndexUsed(
+            Post.objects.filter(topic=1, position__gt=10, position__lte=20)
+                        .order_by('position'),
+            'pybb_post', ['topic_id', 'position'])
+        self.assertIndexUsed(
+            Post.objects.filter(topic=1).order_by('-created')[:2],
+            'pybb_post', ['topic_id', 'created', 'id'])
+        self.assertIndexUsed(
+            Topic.objects.filter(user=1).order_by('-created')[:20],
+            'pybb_topic', ['user_id', 'created'])
+        self.assertIndexUsed(
+            Topic.objects.filter(forum=1).order_by('-created')[:15],
+            'pybb_topic', ['forum_id', 'created'])
+        self.assertIndexUsed(Topic.objects.order_by('-created')[:15],
+                             'pybb_topic', ['created'])
+        self.assertIndexUsed(Post.objects.order_by('-created')[:15],
+                             'pybb_post', ['created'])
@@ -0,0 +1,72 @@
+from django.test import TestCase
+from django.http import HttpRequest
+from django.conf import settings
+from django.db import connection
+from django.contrib.auth import SESSION_KEY, BACKEND_SESSION_KEY
+from django.contrib.auth.models import User
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.sessions.backends.cache import SessionStore
+from django.utils import translation
+
+from pybb.middleware import PybbMiddleware
+from pybb.permissions import request_user
+from pybb.forms import EditProfileForm
+
+
+class Request(HttpRequest):
+    # AuthenticationMiddleware sets the lazy user on the class
+    pass
+
+
+class LanguageMiddlewareTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('user', 'user@example.com', 'pass')
+        self.session = SessionStore()
+        self.session[SESSION_KEY] = self.user.pk
+
+    def tearDown(self):
+        translation.deactivate()
+
+    def process(self, request=None):
+        if request is None:
+            request = HttpRequest()
+            request.session = self.session
+            request.user = self.user
+        old_debug = settings.DEBUG
+        settings.DEBUG = True
+        try:
+            count = len(connection.queries)
+            PybbMiddleware().process_request(request)
+            return len(connection.queries) - count
+        finally:
+            settings.DEBUG = old_debug
+
+    def testLazyUser(self):
+        self.process()
+        self.session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        request = Request()
+        request.session = self.session
+        AuthenticationMiddleware().process_request(request)
+        self.assertEqual(self.process(request), 0)
+        self.assertFalse(hasattr(request, '_cached_user'))
+
+        user = request_user(request)
+        self.assertEqual(user, self.user)
+        self.assertTrue(user is request.user)
+        self.assertTrue(user.pybb_context is request.pybb)
+
+    def testCachedLanguage(self):
+        self.assertEqual(self.process(), 1)
+        self.assertEqual(self.process(), 0)
+        self.assertFalse('django_language' in self.session)
+
+        profile = self.user.pybb_profile
+        form = EditProfileForm({'time_zone': profile.time_zone, 'language': 'ru',
+                                'markup': profile.markup, 'notification_mode': 0},
+                               instance=profile)
+        self.assertTrue(form.is_valid())
+        form.save()
+        self.assertEqual(self.process(), 1)
+        self.assertEqual(self.session['django_language'], 'ru')
+        self.assertEqual(translation.get_language(), 'ru')
+        self.assertEqual(self.process(), 0)
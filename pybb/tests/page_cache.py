@@ -0,0 +1,118 @@
+from django.test import TestCase
+from django.http import HttpRequest, HttpResponse
+from django.core.cache import cache
+from django.conf import settings
+from django.contrib.auth.models import User, AnonymousUser
+
+from pybb.models import Category, Forum, Topic, Post
+from pybb import page_cache
+from pybb.feeds import ForumByIdFeed
+
+
+renders = []
+purged = []
+
+
+def purge_hook(tags):
+    purged.extend(tags)
+
+
+@page_cache.cache_page(page_cache.topic_tags)
+def topic_view(request, topic_id):
+    renders.append(topic_id)
+    return HttpResponse('topic %s' % topic_id)
+
+
+class PageCacheTestCase(TestCase):
+    def setUp(self):
+        self.old_settings = (settings.PYBB_PAGE_CACHE,
+                             settings.PYBB_PAGE_CACHE_PURGE_HOOKS)
+        settings.PYBB_PAGE_CACHE = True
+        settings.PYBB_PAGE_CACHE_PURGE_HOOKS = ('pybb.tests.page_cache.purge_hook',)
+        page_cache._hooks = None
+        del renders[:]
+        del purged[:]
+
+        self.user = User.objects.create_user('user', 'user@example.com', 'pass')
+        category = Category.objects.create(name='category')
+        self.forum = Forum.objects.create(category=category, name='forum')
+        self.topic = Topic.objects.create(forum=self.forum, user=self.user, name='topic')
+        self.other = Topic.objects.create(forum=self.forum, user=self.user, name='other')
+        Post.objects.create(topic=self.topic, user=self.user, body='head')
+        Post.objects.create(topic=self.other, user=self.user, body='head')
+
+    def tearDown(self):
+        settings.PYBB_PAGE_CACHE, settings.PYBB_PAGE_CACHE_PURGE_HOOKS = self.old_settings
+        page_cache._hooks = None
+
+    def get(self, topic, user=None):
+        request = HttpRequest()
+        request.method = 'GET'
+        request.path = '/topic/%d/' % topic.pk
+        request.user = user or AnonymousUser()
+        return topic_view(request, str(topic.pk))
+
+    def testTargetedPurge(self):
+        response = self.get(self.topic)
+        self.assertEqual(response['Surrogate-Key'], 'topic:%d' % self.topic.pk)
+        self.get(self.other)
+        self.assertEqual(self.get(self.topic).content, 'topic %d' % self.topic.pk)
+        self.assertEqual(len(renders), 2)
+
+        # only pages of the changed topic are purged
+        del purged[:]
+        Post.objects.create(topic=self.topic, user=self.user, body='reply')
+        self.assertTrue('topic:%d' % self.topic.pk in purged)
+        self.assertTrue('forum:%d' % self.forum.pk in purged)
+        self.assertFalse('topic:%d' % self.other.pk in purged)
+        self.get(self.topic)
+        self.get(self.other)
+        self.assertEqual(len(renders), 3)
+
+    def testAuthenticated(self):
+        self.get(self.topic, self.user)
+        self.get(self.topic, self.user)
+        self.assertEqual(len(renders), 2)
+
+
+class CountingFeed(ForumByIdFeed):
+    def items(self, obj):
+        renders.append(obj.pk)
+        return super(CountingFeed, self).items(obj)
+
+
+class FeedCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        del renders[:]
+        self.user = User.objects.create_user('user', 'user@example.com', 'pass')
+        category = Category.objects.create(name='category')
+        self.forum = Forum.objects.create(category=category, name='forum')
+        self.other = Forum.objects.create(category=category, name='other')
+        self.topic = Topic.objects.create(forum=self.forum, user=self.user, name='topic')
+        Post.objects.create(topic=self.topic, user=self.user, body='head')
+
+    def get(self, forum, user=None, etag=None):
+        request = HttpRequest()
+        request.method = 'GET'
+        request.path = '/feed/forum/id/%d/topic' % forum.pk
+        request.user = user or AnonymousUser()
+        if etag:
+            request.META['HTTP_IF_NONE_MATCH'] = etag
+        return CountingFeed()(request, str(forum.pk))
+
+    def testCachedFeed(self):
+        response = self.get(self.forum)
+        self.assertTrue('topic' in response.content)
+        self.assertEqual(response.content, self.get(self.forum, self.user).content)
+        self.assertEqual(self.get(self.forum, etag=response['ETag']).status_code, 304)
+        self.assertEqual(len(renders), 1)
+
+        # feeds are regenerated after changes of their forums only
+        self.get(self.other)
+        topic = Topic.objects.create(forum=self.forum, user=self.user, name='new topic')
+        Post.objects.create(topic=topic, user=self.user, body='head')
+        self.get(self.other)
+        self.assertEqual(len(renders), 2)
+        self.assertTrue('new topic' in self.get(self.forum).content)
+        self.assertEqual(len(renders), 3)
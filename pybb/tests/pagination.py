@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta
+from cgi import parse_qsl
+
+from django.test import TestCase
+from django.http import HttpRequest, QueryDict
+from django.contrib.auth.models import User
+
+from pybb.models import Category, Forum, Topic, Post
+from pybb.pagination import paginate_keyset, paginate_positions
+
+
+class KeysetPaginationTestCase(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('user', 'user@example.com', 'pass')
+        category = Category.objects.create(name='category')
+        self.forum = Forum.objects.create(category=category, name='forum')
+        now = datetime.now()
+        for x in range(25):
+            topic = Topic.objects.create(forum=self.forum, user=user,
+                                         name='topic %d' % x)
+            # topics on the border of first and second page have the same update time
+            Topic.objects.filter(pk=topic.pk).update(
+                updated=now - timedelta(minutes=x - (x == 9)),
+                sticky=(x == 20))
+        self.topics = list(self.forum.topics.order_by('-sticky', '-updated', '-id'))
+
+    def paginate(self, query_string=''):
+        request = HttpRequest()
+        request.GET = QueryDict(query_string)
+        request.META['QUERY_STRING'] = query_string
+        return paginate_keyset(self.forum.topics.all(), request, 10,
+                               ['-sticky', '-updated', '-id'], depth=1)
+
+    def follow(self, url):
+        return self.paginate(url.lstrip('?'))
+
+    def testWalkForward(self):
+        page = self.paginate()
+        self.assertEqual(self.topics[:10], page.object_list)
+        self.assertTrue('after' in dict(parse_qsl(page.next_page_url.lstrip('?'))))
+
+        page = self.follow(page.next_page_url)
+        self.assertEqual(self.topics[10:20], page.object_list)
+        page = self.follow(page.next_page_url)
+        self.assertEqual(self.topics[20:], page.object_list)
+        self.assertFalse(page.has_next())
+
+        page = self.follow(page.previous_page_url)
+        self.assertEqual(self.topics[10:20], page.object_list)
+
+    def testLastPage(self):
+        page = self.paginate()
+        page = self.follow(page.last_page_url)
+        self.assertEqual(self.topics[15:], page.object_list)
+        self.assertFalse(page.has_next())
+        self.assertTrue(page.has_previous())
+
+    def testInvalidCursor(self):
+        page = self.paginate('after=foo')
+        self.assertEqual(1, page.number)
+        self.assertEqual(self.topics[:10], page.object_list)
+
+
+class PositionPaginationTestCase(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('user', 'user@example.com', 'pass')
+        category = Category.objects.create(name='category')
+        forum = Forum.objects.create(category=category, name='forum')
+        self.topic = Topic.objects.create(forum=forum, user=user, name='topic')
+        self.posts = [Post.objects.create(topic=self.topic, user=user, body='post %d' % x)
+                      for x in range(25)]
+
+    def paginate(self, query_string=''):
+        request = HttpRequest()
+        request.GET = QueryDict(query_string)
+        request.META['QUERY_STRING'] = query_string
+        topic = Topic.objects.get(pk=self.topic.pk)
+        return paginate_positions(topic.posts.all(), request, 10, topic.post_count)
+
+    def testPositions(self):
+        self.assertEqual(range(1, 26), [x.position for x in self.posts])
+        page = self.paginate('page=3')
+        self.assertEqual([x.pk for x in self.posts[20:]], [x.pk for x in page.object_list])
+        self.assertFalse(page.has_next())
+
+    def testRepairPositions(self):
+        Post.objects.filter(pk=self.posts[3].pk).update(position=3)
+        Post.objects.filter(pk=self.posts[4].pk).update(position=0)
+        self.topic.update_post_positions()
+        self.assertEqual(range(1, 26), list(self.topic.posts.order_by('created', 'id')
+                                            .values_list('position', flat=True)))
+
+    def testDelete(self):
+        self.posts[5].delete()
+        page = self.paginate('page=1')
+        self.assertEqual([x.pk for x in self.posts[:5] + self.posts[6:11]],
+                         [x.pk for x in page.object_list])
+        self.assertEqual(range(1, 11), [x.position for x in page.object_list])
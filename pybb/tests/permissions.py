@@ -0,0 +1,50 @@
+from django.test import TestCase
+from django.contrib.auth.models import User, AnonymousUser
+
+from pybb.models import Category, Forum, Topic, Post
+from pybb.permissions import is_moderator, is_subscribed, can_edit_post, \
+                             can_delete_post, UserContext
+
+
+class PermissionsTestCase(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author', 'author@example.com', 'pass')
+        self.moderator = User.objects.create_user('moderator', 'moderator@example.com', 'pass')
+        self.user = User.objects.create_user('user', 'user@example.com', 'pass')
+        category = Category.objects.create(name='category')
+        self.forum = Forum.objects.create(category=category, name='forum')
+        self.forum.moderators.add(self.moderator)
+        self.topic = Topic.objects.create(forum=self.forum, user=self.author, name='topic')
+        self.head = Post.objects.create(topic=self.topic, user=self.author, body='head')
+        self.post = Post.objects.create(topic=self.topic, user=self.author, body='reply')
+        self.topic.subscribers.add(self.user)
+
+    def testModerator(self):
+        self.assertTrue(is_moderator(self.moderator, self.forum.pk))
+        self.assertFalse(is_moderator(self.user, self.forum.pk))
+        self.assertFalse(is_moderator(AnonymousUser(), self.forum.pk))
+
+    def testSubscriber(self):
+        self.assertTrue(is_subscribed(self.user, self.topic.pk))
+        self.assertFalse(is_subscribed(self.author, self.topic.pk))
+        self.assertFalse(is_subscribed(AnonymousUser(), self.topic.pk))
+
+    def testPostPermissions(self):
+        head = Post.objects.get(pk=self.head.pk)
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertTrue(can_edit_post(self.author, head))
+        self.assertTrue(can_edit_post(self.moderator, head))
+        self.assertFalse(can_edit_post(self.user, head))
+        self.assertTrue(can_delete_post(self.author, post))
+        self.assertFalse(can_delete_post(self.author, head))
+        self.assertTrue(can_delete_post(self.moderator, head))
+
+    def testUserContext(self):
+        self.moderator.pybb_context = UserContext(self.moderator)
+        self.assertTrue(is_moderator(self.moderator, self.forum.pk))
+        self.assertFalse(is_subscribed(self.moderator, self.topic.pk))
+        self.assertFalse(self.moderator.pybb_context.is_banned)
+
+        # data is loaded once per request
+        self.topic.subscribers.add(self.moderator)
+        self.assertFalse(is_subscribed(self.moderator, self.topic.pk))
@@ -0,0 +1,31 @@
+import unittest
+from datetime import datetime
+
+from pybb.read_tracking import ReadMap
+
+
+class ReadMapTestCase(unittest.TestCase):
+    def testGet(self):
+        read_map = ReadMap({'1': [10, 100], '2': 20}, limit=10)
+        self.assertEqual(10, read_map.get(1))
+        self.assertEqual(20, read_map.get(2))
+        self.assertEqual(0, read_map.get(3))
+
+    def testTouch(self):
+        read_map = ReadMap(None, limit=10)
+        read_map.touch(1, 10, 100)
+        self.assertEqual({'1': [10, 100]}, read_map.data)
+        self.assertEqual(None, read_map.evict())
+
+    def testEvictLeastRecentlyTouched(self):
+        read_map = ReadMap({'1': [10, 300], '2': [20, 100], '3': [30, 200]},
+                           limit=2)
+        read_map.touch(4, 40, 400)
+        # the oldest touch of evicted entries (100 and 200)
+        self.assertEqual(datetime.fromtimestamp(100), read_map.evict())
+        self.assertEqual(['1', '4'], sorted(read_map.data.keys()))
+
+    def testEvictOldStyleEntriesFirst(self):
+        read_map = ReadMap({'1': 10, '2': [20, 100]}, limit=1)
+        self.assertEqual(None, read_map.evict())
+        self.assertEqual(['2'], read_map.data.keys())
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+from django.test import TestCase
+from django.core.cache import cache
+from django.core.management import call_command
+from django.contrib.auth.models import User
+
+from pybb.models import Category, Forum, Topic, Post, SearchTerm, \
+                        SearchPosting
+from pybb.search import tokenize, search_posts, decode_cursor
+
+
+class SearchTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('user', 'user@example.com', 'pass')
+        self.other = User.objects.create_user('other', 'other@example.com', 'pass')
+        category = Category.objects.create(name='category')
+        self.forum = Forum.objects.create(category=category, name='forum')
+        self.forum2 = Forum.objects.create(category=category, name='forum2')
+        self.topic = self.create_topic(self.forum, 'Django caching', 'how to cache pages')
+        self.topic2 = self.create_topic(self.forum2, 'Templates', 'cache cache templates')
+        self.reply = Post.objects.create(topic=self.topic, user=self.other,
+                                         body='use the page cache')
+
+    def create_topic(self, forum, name, body):
+        topic = Topic.objects.create(forum=forum, user=self.user, name=name)
+        Post.objects.create(topic=topic, user=self.user, body=body)
+        return topic
+
+    def search(self, query, **kwargs):
+        posts, cursor = search_posts(query, 10, **kwargs)
+        return [x.pk for x in posts]
+
+    def term_count(self, term):
+        return SearchTerm.objects.get(term=term).post_count
+
+    def testTokenize(self):
+        self.assertEqual(tokenize(u'Cache, cache a Тест!'),
+                         {u'cache': 2, u'тест': 1})
+
+    def testRanking(self):
+        head = self.topic.head.pk
+        head2 = self.topic2.head.pk
+        self.assertEqual(self.search('cache'), [head2, self.reply.pk, head])
+        # topic names are indexed with head posts
+        self.assertEqual(self.search('django templates'), [])
+        self.assertEqual(self.search('django pages'), [head])
+        self.assertEqual(self.search('unknown cache'), [])
+
+        self.assertEqual(self.search('cache', forum=self.forum.pk),
+                         [self.reply.pk, head])
+        self.assertEqual(self.search('cache', user=self.other.pk), [self.reply.pk])
+
+    def testPagination(self):
+        posts, cursor = search_posts('cache', 2)
+        self.assertEqual(len(posts), 2)
+        rest, cursor = search_posts('cache', 2, after=decode_cursor(cursor))
+        self.assertEqual([x.pk for x in posts + rest], self.search('cache'))
+        self.assertEqual(cursor, None)
+
+    def testUpdates(self):
+        self.assertEqual(self.term_count('cache'), 3)
+        self.reply.body = 'use memcached'
+        self.reply.save()
+        self.assertEqual(self.search('memcached'), [self.reply.pk])
+        self.assertEqual(self.term_count('cache'), 2)
+
+        # postings are deleted with topics
+        self.topic2.delete()
+        self.assertEqual(self.term_count('cache'), 1)
+        self.assertEqual(self.term_count('templates'), 0)
+        self.assertEqual(self.search('cache'), [self.topic.head.pk])
+
+    def testBuildCommand(self):
+        count = SearchPosting.objects.count()
+        SearchPosting.objects.all().delete()
+        SearchTerm.objects.all().delete()
+        call_command('pybb_build_search_index', chunk_size=2)
+        self.assertEqual(SearchPosting.objects.count(), count)
+        self.assertEqual(self.term_count('cache'), 3)
@@ -0,0 +1,162 @@
+from datetime import datetime, timedelta
+
+from django.test import TestCase
+from django.conf import settings
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.contrib.auth.models import User
+
+from pybb.models import Category, Forum, Topic, Post, Notification, Digest, \
+                        SubscriptionState, NOTIFY_DAILY
+from pybb.subscription import send_notifications, send_digests, filter_visited, \
+                              claim_digest, merge_digest
+from pybb.read_tracking import update_read_tracking
+
+
+class FailingEmailBackend(EmailBackend):
+    """
+    Backend which fails to send messages to bad@example.com.
+    """
+
+    def send_messages(self, messages):
+        for message in messages:
+            if 'bad@example.com' in message.to:
+                raise Exception('Invalid recipient')
+        return super(FailingEmailBackend, self).send_messages(messages)
+
+
+class SubscriptionTestCase(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author', 'author@example.com', 'pass')
+        self.reader = User.objects.create_user('reader', 'reader@example.com', 'pass')
+        category = Category.objects.create(name='category')
+        self.forum = Forum.objects.create(category=category, name='forum')
+        self.topic = Topic.objects.create(forum=self.forum, user=self.author, name='topic')
+        Post.objects.create(topic=self.topic, user=self.author, body='head')
+        self.topic.subscribers.add(self.author, self.reader)
+
+    def testEnqueue(self):
+        post = Post.objects.create(topic=self.topic, user=self.author, body='reply')
+        items = Notification.objects.all()
+        self.assertEqual([(self.reader.pk, post.pk)],
+                         [(x.user_id, x.post_id) for x in items])
+        self.assertEqual(0, len(mail.outbox))
+
+    def testSend(self):
+        Post.objects.create(topic=self.topic, user=self.author, body='reply')
+        self.assertEqual((1, 0), send_notifications())
+        self.assertEqual(1, len(mail.outbox))
+        self.assertEqual(['reader@example.com'], mail.outbox[0].to)
+        self.assertEqual(u'RE: topic', mail.outbox[0].subject)
+        self.assertEqual(0, Notification.objects.count())
+
+    def testSendToManyRecipients(self):
+        for x in range(3):
+            user = User.objects.create_user('user%d' % x, 'user%d@example.com' % x, 'pass')
+            self.topic.subscribers.add(user)
+        Post.objects.create(topic=self.topic, user=self.author, body='reply')
+        self.assertEqual((4, 0), send_notifications(batch_size=10))
+        self.assertEqual(4, len(mail.outbox))
+        self.assertEqual(1, len(set(x.body for x in mail.outbox)))
+
+    def testFailedItemIsNotResent(self):
+        for name in ('bad', 'good'):
+            user = User.objects.create_user(name, '%s@example.com' % name, 'pass')
+            self.topic.subscribers.add(user)
+        Post.objects.create(topic=self.topic, user=self.author, body='reply')
+        old_backend = settings.EMAIL_BACKEND
+        settings.EMAIL_BACKEND = 'pybb.tests.subscription.FailingEmailBackend'
+        try:
+            self.assertEqual((2, 1), send_notifications())
+        finally:
+            settings.EMAIL_BACKEND = old_backend
+        self.assertEqual(['good@example.com', 'reader@example.com'],
+                         sorted(x.to[0] for x in mail.outbox))
+        self.assertEqual(['bad'], [x.user.username for x in Notification.objects.all()])
+
+    def testDelayedItemsAreNotSent(self):
+        Post.objects.create(topic=self.topic, user=self.author, body='reply')
+        Notification.objects.update(next_attempt=datetime.now() + timedelta(hours=1))
+        self.assertEqual((0, 0), send_notifications())
+        self.assertEqual(0, len(mail.outbox))
+
+    def testNotifyUntilVisited(self):
+        Post.objects.create(topic=self.topic, user=self.author, body='reply')
+        Post.objects.create(topic=self.topic, user=self.author, body='reply')
+        self.assertEqual(1, Notification.objects.count())
+        self.assertEqual([self.reader.pk], list(SubscriptionState.objects
+                                                .values_list('user', flat=True)))
+
+        # the visit deletes the state
+        topic = Topic.objects.get(pk=self.topic.pk)
+        update_read_tracking(topic, User.objects.get(pk=self.reader.pk))
+        self.assertEqual(0, SubscriptionState.objects.count())
+        Post.objects.create(topic=self.topic, user=self.author, body='reply')
+        self.assertEqual(2, Notification.objects.count())
+
+    def testVisitedFilterUsesRecipientsOnly(self):
+        first = Post.objects.create(topic=self.topic, user=self.author, body='reply')
+        SubscriptionState.objects.create(user=self.author, topic=self.topic, post=first)
+        post = Post.objects.create(topic=self.topic, user=self.reader, body='reply')
+        self.assertEqual([], filter_visited(post, []))
+        self.assertEqual(first.pk, SubscriptionState.objects.get(user=self.author).post_id)
+        # existing states are not inserted again
+        self.assertEqual([], filter_visited(post, [self.reader.pk]))
+
+    def testDigest(self):
+        profile = self.reader.pybb_profile
+        profile.notification_mode = NOTIFY_DAILY
+        profile.save()
+        first = Post.objects.create(topic=self.topic, user=self.author, body='reply')
+        Post.objects.create(topic=self.topic, user=self.author, body='reply')
+        # digests are merged by the outbox worker
+        self.assertEqual(0, Digest.objects.count())
+        self.assertEqual((2, 0), send_notifications())
+        self.assertEqual(0, len(mail.outbox))
+        self.assertEqual(0, Notification.objects.count())
+        digest = Digest.objects.get(user=self.reader)
+        self.assertEqual({str(self.topic.pk): [first.pk, 2]}, digest.topics)
+
+        self.assertEqual((0, 0), send_digests())
+        Digest.objects.update(due=datetime.now())
+        self.assertEqual((1, 0), send_digests())
+        self.assertEqual(1, len(mail.outbox))
+        self.assertEqual(['reader@example.com'], mail.outbox[0].to)
+        self.assertTrue('2 new posts' in mail.outbox[0].body)
+        self.assertEqual(0, Digest.objects.count())
+
+    def testDigestClaim(self):
+        key = str(self.topic.pk)
+        merge_digest(self.reader.pk, {key: [10, 1]}, datetime.now())
+        stale = Digest.objects.get(user=self.reader)
+        merge_digest(self.reader.pk, {key: [5, 2]}, datetime.now())
+        # the digest changed after it was loaded is not claimed
+        self.assertFalse(claim_digest(stale))
+        digest = Digest.objects.get(user=self.reader)
+        self.assertEqual({key: [5, 3]}, digest.topics)
+
+        self.assertTrue(claim_digest(digest))
+        self.assertFalse(claim_digest(digest))
+        # posts merged after the claim go into a new digest
+        merge_digest(self.reader.pk, {key: [20, 1]}, datetime.now())
+        self.assertEqual({key: [20, 1]}, Digest.objects.get(user=self.reader).topics)
+
+    def testFailedDigest(self):
+        profile = self.reader.pybb_profile
+        profile.notification_mode = NOTIFY_DAILY
+        profile.save()
+        User.objects.filter(pk=self.reader.pk).update(email='bad@example.com')
+        Post.objects.create(topic=self.topic, user=self.author, body='reply')
+        send_notifications()
+
+        old_backend = settings.EMAIL_BACKEND
+        settings.EMAIL_BACKEND = 'pybb.tests.subscription.FailingEmailBackend'
+        try:
+            for attempt in xrange(settings.PYBB_NOTIFICATION_MAX_ATTEMPTS):
+                Digest.objects.filter(due__isnull=False).update(due=datetime.now())
+                self.assertEqual((0, 1), send_digests())
+        finally:
+            settings.EMAIL_BACKEND = old_backend
+        digest = Digest.objects.get(user=self.reader)
+        self.assertEqual(None, digest.due)
+        self.assertEqual('Invalid recipient', digest.error)
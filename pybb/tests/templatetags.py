@@ -0,0 +1,83 @@
+from datetime import datetime
+
+from django.test import TestCase
+from django.template import Template, Context
+from django.conf import settings
+from django.utils import simplejson
+from django.contrib.auth.models import User, AnonymousUser
+
+from pybb.models import Category, Forum, Topic
+from pybb.pagination import mini_pagination, load_mini_pagination
+from pybb.templatetags.pybb_tags import pybb_topic_mini_pagination
+
+
+class TimeTagTestCase(TestCase):
+    def setUp(self):
+        self.old_client_time = settings.PYBB_CLIENT_TIME
+        settings.PYBB_CLIENT_TIME = True
+
+    def tearDown(self):
+        settings.PYBB_CLIENT_TIME = self.old_client_time
+
+    def render(self, value, user):
+        template = Template('{% load pybb_tags %}{% pybb_time value %}')
+        return template.render(Context({'value': value, 'user': user,
+                                        'LANGUAGE_CODE': 'en'}))
+
+    def testClientTime(self):
+        value = datetime.fromtimestamp(1286280000)
+        user = User.objects.create_user('user', 'user@example.com', 'pass')
+        html = self.render(value, AnonymousUser())
+        self.assertEqual(html, self.render(value, user))
+        self.assertEqual(html, '<time class="pybb-time" datetime="2010-10-05T12:00:00Z">'
+                               '05 Oct, 2010 12:00 UTC</time>')
+
+
+    def testMessages(self):
+        html = Template('{% load pybb_tags %}{% pybb_time_messages %}').render(Context())
+        messages = simplejson.loads(html[html.index('{'):html.rindex('}') + 1])
+        self.assertEqual(messages['seconds'][1], '1 second ago')
+        self.assertEqual(messages['seconds'][59], '59 seconds ago')
+        self.assertEqual(messages['minutes'][2], '2 minutes ago')
+        self.assertEqual(messages['months'][0], 'Jan')
+
+
+class MiniPaginationTestCase(TestCase):
+    def setUp(self):
+        self.old_page_size = settings.PYBB_TOPIC_PAGE_SIZE
+        settings.PYBB_TOPIC_PAGE_SIZE = 10
+
+    def tearDown(self):
+        settings.PYBB_TOPIC_PAGE_SIZE = self.old_page_size
+
+    def render(self, topic):
+        # the inclusion template belongs to the project templates
+        context = pybb_topic_mini_pagination(topic)
+        self.assertEqual(context['is_paginated'], context['pagination'] is not None)
+        return context['pagination'] or ''
+
+    def testLinks(self):
+        user = User.objects.create_user('user', 'user@example.com', 'pass')
+        category = Category.objects.create(name='foo')
+        forum = Forum.objects.create(category=category, name='foo')
+        topic = Topic.objects.create(forum=forum, user=user, name='foo')
+        url = topic.get_absolute_url()
+
+        topic.post_count = 10
+        self.assertEqual(self.render(topic), '')
+        topic.post_count = 21
+        self.assertEqual(self.render(topic),
+            '<a href="%(url)s?page=1">1</a>, <a href="%(url)s?page=2">2</a>, '
+            '<a href="%(url)s?page=3">3</a>' % {'url': url})
+        topic.post_count = 100
+        self.assertEqual(self.render(topic),
+            '<a href="%(url)s?page=1">1</a>, <a href="%(url)s?page=2">2</a> ... '
+            '<a href="%(url)s?page=9">9</a>, <a href="%(url)s?page=10">10</a>'
+            % {'url': url})
+
+        # precomputed links are not rebuilt
+        links = self.render(topic)
+        load_mini_pagination([topic])
+        topic.post_count = 1
+        self.assertEqual(self.render(topic), links)
+        self.assertEqual(mini_pagination(topic), '')
@@ -0,0 +1,57 @@
+from django.test import TestCase
+from django.conf import settings
+from django.contrib.auth.models import User
+
+from pybb.models import UserNgram
+from pybb.user_search import search_users, get_ngrams, update_user_ngrams
+from pybb.pagination import encode_cursor, decode_cursor
+
+
+class UserSearchTestCase(TestCase):
+    def setUp(self):
+        self.old_ngrams = settings.PYBB_USER_SEARCH_NGRAMS
+        for name in ('alice', 'alicia', 'bob', 'malice', 'Ali.Baba'):
+            User.objects.create_user(name, '%s@example.com' % name.lower(), 'pass')
+
+    def tearDown(self):
+        settings.PYBB_USER_SEARCH_NGRAMS = self.old_ngrams
+
+    def search(self, query):
+        qs = search_users(User.objects.all(), query)
+        return sorted(qs.values_list('username', flat=True))
+
+    def testPrefix(self):
+        settings.PYBB_USER_SEARCH_NGRAMS = False
+        self.assertEqual(self.search('ali'), ['alice', 'alicia'])
+        self.assertEqual(self.search('Ali.'), ['Ali.Baba'])
+        self.assertEqual(len(self.search('')), 5)
+
+    def testNgrams(self):
+        settings.PYBB_USER_SEARCH_NGRAMS = True
+        for user in User.objects.all():
+            update_user_ngrams(user)
+        self.assertEqual(get_ngrams('Alice'), set(['ali', 'lic', 'ice']))
+        self.assertEqual(self.search('lic'), ['alice', 'alicia', 'malice'])
+        self.assertEqual(self.search('alice'), ['alice', 'malice'])
+
+        # trigrams follow renames
+        user = User.objects.get(username='bob')
+        user.username = 'bobalice'
+        user.save()
+        self.assertEqual(self.search('alice'), ['alice', 'bobalice', 'malice'])
+        self.assertEqual(UserNgram.objects.filter(user=user, ngram='bob').count(), 1)
+        self.assertEqual(UserNgram.objects.filter(user=user).count(), 6)
+
+        # trigrams are not touched if the username is not changed
+        UserNgram.objects.filter(user=user).delete()
+        user = User.objects.get(username='bobalice')
+        user.email = 'bobalice@example.com'
+        user.save()
+        self.assertFalse(UserNgram.objects.filter(user=user).exists())
+
+    def testCursor(self):
+        user = User.objects.get(username='Ali.Baba')
+        fields = [User._meta.get_field('username')]
+        cursor = encode_cursor(user, fields)
+        self.assertEqual(decode_cursor(cursor, fields), [u'Ali.Baba'])
+        self.assertRaises(ValueError, decode_cursor, 'xyz', fields)
@@ -0,0 +1,142 @@
+"""
+Thumbnails of image attachments.
+
+Thumbnails are generated once and stored in ``PYBB_THUMBNAIL_UPLOAD_TO``
+directory under names built from ``Attachment.hash`` and the size, so their
+URLs never change and they are served with long-lived caching headers.
+
+Missing thumbnails are generated on the first request. Only one process
+generates the thumbnail at a time (the lock is taken with ``cache.add``),
+other requests are redirected to the full image meanwhile.
+``pybb_make_thumbnails`` command generates thumbnails in background.
+
+PIL is optional, without it full images are always served.
+"""
+import os
+import tempfile
+
+try:
+    from PIL import Image
+except ImportError:
+    try:
+        import Image
+    except ImportError:
+        Image = None
+
+from django.core.cache import cache
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+
+LOCK_TIMEOUT = 60
+
+
+def is_image(attachment):
+    return attachment.content_type in settings.PYBB_THUMBNAIL_CONTENT_TYPES
+
+
+def get_thumbnail_path(attachment, size):
+    width, height = settings.PYBB_THUMBNAIL_SIZES[size]
+    if attachment.content_type == 'image/jpeg':
+        ext = 'jpg'
+    else:
+        ext = 'png'
+    name = '%s_%dx%d.%s' % (attachment.hash, width, height, ext)
+    return os.path.join(settings.MEDIA_ROOT, settings.PYBB_THUMBNAIL_UPLOAD_TO,
+                        attachment.hash[:2], name)
+
+
+def generate_thumbnail(attachment, size, path):
+    """
+    Write the thumbnail of the attachment to the path.
+
+    The image is saved into the temporary file which is renamed then,
+    so readers never see partially written thumbnail.
+    """
+
+    image = Image.open(attachment.get_absolute_path())
+    if image.mode not in ('RGB', 'RGBA', 'L'):
+        image = image.convert('RGBA')
+    image.thumbnail(settings.PYBB_THUMBNAIL_SIZES[size], Image.ANTIALIAS)
+
+    dirname = os.path.dirname(path)
+    if not os.path.exists(dirname):
+        os.makedirs(dirname)
+    fd, temp_path = tempfile.mkstemp(dir=dirname, prefix='.thumbnail')
+    try:
+        fobj = os.fdopen(fd, 'wb')
+        try:
+            if path.endswith('.jpg'):
+                if image.mode == 'RGBA':
+                    image = image.convert('RGB')
+                image.save(fobj, 'JPEG', quality=85)
+            else:
+                image.save(fobj, 'PNG')
+        finally:
+            fobj.close()
+        os.rename(temp_path, path)
+    except:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def get_thumbnail(attachment, size, wait=False):
+    """
+    Return path of the thumbnail, generate it if it does not exist.
+
+    Return None if the thumbnail can not be generated now: PIL is not
+    installed, the attachment is not an image or another process generates
+    the thumbnail. With ``wait`` flag the thumbnail is generated even if
+    another process holds the lock.
+    """
+
+    if Image is None or not is_image(attachment):
+        return None
+    path = get_thumbnail_path(attachment, size)
+    if os.path.exists(path):
+        return path
+
+    lock_key = 'pybb:thumbnail_lock:%s:%s' % (attachment.hash, size)
+    locked = cache.add(lock_key, 1, LOCK_TIMEOUT)
+    if not locked and not wait:
+        return None
+    try:
+        # the thumbnail could be generated while the lock was acquired
+        if not os.path.exists(path):
+            generate_thumbnail(attachment, size, path)
+    finally:
+        if locked:
+            cache.delete(lock_key)
+    return path
+
+
+def delete_thumbnails(attachment):
+    for size in settings.PYBB_THUMBNAIL_SIZES:
+        path = get_thumbnail_path(attachment, size)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def serve_thumbnail(request, path):
+    """
+    Return response with the thumbnail.
+
+    Thumbnail files are never changed, so clients may cache them forever.
+    Attachments are available to logged in users only, so shared caches
+    must not store them.
+    """
+
+    etag = '"%s"' % os.path.basename(path)
+    if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+        response = HttpResponseNotModified()
+    else:
+        if path.endswith('.jpg'):
+            content_type = 'image/jpeg'
+        else:
+            content_type = 'image/png'
+        content = open(path, 'rb').read()
+        response = HttpResponse(content, content_type=content_type)
+        response['Content-Length'] = str(len(content))
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, max-age=%d' % settings.PYBB_THUMBNAIL_MAX_AGE
+    return response
@@ -2,6 +2,7 @@ from django.conf.urls.defaults import *
 
 from pybb import views
 from pybb import feeds
+from pybb import api
 
 
 urlpatterns = patterns('',
@@ -10,6 +11,12 @@ urlpatterns = patterns('',
     url('^feed/all/topic$', feeds.LatestTopicFeed(), name='pybb_feed_topic'),
     url('^feed/forum/tag/(\w+)/topic$', feeds.ForumByTagFeed(), name='pybb_feed_forum_bytag_topic'),
     url('^feed/forum/id/(\d+)/topic$', feeds.ForumByIdFeed(), name='pybb_feed_forum_byid_topic'),
+
+    # Read-only JSON API
+    url('^api/category/$', api.category_list, name='pybb_api_category_list'),
+    url('^api/forum/$', api.forum_list, name='pybb_api_forum_list'),
+    url('^api/forum/(\d+)/topic/$', api.topic_list, name='pybb_api_topic_list'),
+    url('^api/topic/(\d+)/post/$', api.post_list, name='pybb_api_post_list'),
 )
 
 urlpatterns += patterns('pybb.views',
@@ -18,6 +25,9 @@ urlpatterns += patterns('pybb.views',
     url('^category/(\d+)/$', 'category_details', name='pybb_category_details'),
     url('^forum/(\d+)/$', 'forum_details', name='pybb_forum_details'),
 
+    # Search
+    url('^search/$', 'search', name='pybb_search'),
+
     # User
     url('^user/$', 'user_list', name='pybb_user_list'),
     url('^user/([^/]+)/$', 'user_details', name='pybb_user_details'),
@@ -47,6 +57,7 @@ urlpatterns += patterns('pybb.views',
 
     # Attachment
     url('^attachment/(\w+)/$', 'attachment_details', name='pybb_attachment_details'),
+    url('^attachment/(\w+)/thumbnail/(\w+)/$', 'attachment_thumbnail', name='pybb_attachment_thumbnail'),
 
     # Subscription
     url('^subscription/topic/(\d+)/delete/$',
@@ -0,0 +1,76 @@
+"""
+User search.
+
+By default users are searched by prefix of the username. The prefix is
+matched with a range of usernames, so the unique index of ``username``
+column is used and the search does not scan the whole table.
+
+If ``PYBB_USER_SEARCH_NGRAMS`` option is enabled then usernames are searched
+by substring. Trigrams of usernames are stored in ``UserNgram`` table, users
+having all trigrams of the query are selected with the index of that table
+and then checked with the substring match. The table is updated when the
+user is created or renamed, ``pybb_build_user_ngrams`` command fills it for
+existing users.
+"""
+from django.conf import settings
+from django.db.models import Count
+
+from pybb.models import UserNgram
+from pybb.util import bulk_insert
+
+NGRAM_SIZE = 3
+
+
+def get_ngrams(text):
+    """
+    Return set of trigrams of the lowercased text.
+    """
+
+    text = text.lower()
+    return set(text[x:x + NGRAM_SIZE]
+               for x in xrange(len(text) - NGRAM_SIZE + 1))
+
+
+def update_user_ngrams(user):
+    """
+    Synchronize trigrams of the user with the username.
+    """
+
+    ngrams = get_ngrams(user.username)
+    current = set(UserNgram.objects.filter(user=user.pk)
+                  .values_list('ngram', flat=True))
+    if current - ngrams:
+        UserNgram.objects.filter(user=user.pk,
+                                 ngram__in=list(current - ngrams)).delete()
+    bulk_insert(UserNgram, ('user_id', 'ngram'),
+                [(user.pk, x) for x in ngrams - current])
+
+
+def filter_prefix(qs, query):
+    # the range makes the condition sargable, the LIKE check
+    # is evaluated only for rows inside the range
+    return qs.filter(username__gte=query, username__lt=query + u'\uffff',
+                     username__startswith=query)
+
+
+def filter_substring(qs, query):
+    ngrams = get_ngrams(query)
+    if not ngrams:
+        return filter_prefix(qs, query)
+    candidates = UserNgram.objects.filter(ngram__in=list(ngrams))\
+                                  .values('user').annotate(found=Count('id'))\
+                                  .filter(found=len(ngrams)).values('user')
+    return qs.filter(pk__in=candidates,
+                     username__icontains=query)
+
+
+def search_users(qs, query):
+    """
+    Filter the queryset of users by the query.
+    """
+
+    if not query:
+        return qs
+    if settings.PYBB_USER_SEARCH_NGRAMS:
+        return filter_substring(qs, query)
+    return filter_prefix(qs, query)
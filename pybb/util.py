@@ -15,6 +15,7 @@ from django.template.defaultfilters import urlize as django_urlize
 from django.core.paginator import Paginator, EmptyPage, InvalidPage
 from django.conf import settings
 from django.contrib.sites.models import Site
+from django.db import connection, transaction
 
 
 def urlize(data):
@@ -100,3 +101,25 @@ def gravatar_url(email):
     default = urllib.quote(url)
     url = 'http://www.gravatar.com/avatar/%s?s=%d&d=%s' % (hash, size, default)
     return url
+
+
+def bulk_insert(model, fields, rows):
+    """
+    Insert rows into the table of the model with one executemany call.
+
+    Args:
+        model: the model class
+        fields: list of column names
+        rows: list of tuples with values prepared for the database
+    """
+
+    if not rows:
+        return
+    qn = connection.ops.quote_name
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+        qn(model._meta.db_table),
+        ', '.join(qn(x) for x in fields),
+        ', '.join(['%s'] * len(fields)))
+    cursor = connection.cursor()
+    cursor.executemany(sql, rows)
+    transaction.commit_unless_managed()
@@ -17,6 +17,7 @@ from django.contrib.auth.decorators import login_required
 from django.conf import settings
 from django.core.urlresolvers import reverse
 from django.db import connection
+from django.db.models import F
 from django.utils.translation import ugettext_lazy as _
 
 from common.decorators import render_to, ajax
@@ -24,13 +25,24 @@ from common.orm import load_related
 from common.pagination import paginate
 
 from pybb.markups import mypostmarkup
+from pybb.pagination import paginate_keyset, paginate_positions, \
+                            load_mini_pagination, page_qs
+from pybb.cache import get_or_set, get_forum_tree
 from pybb.util import quote_text, set_language, urlize
 from pybb.models import Category, Forum, Topic, Post, Profile, \
-                        Attachment, MARKUP_CHOICES
+                        Attachment, SubscriptionState, MARKUP_CHOICES
 from pybb.forms import  AddPostForm, EditPostForm, EditHeadPostForm, \
-                        EditProfileForm, UserSearchForm
+                        EditProfileForm, UserSearchForm, SearchForm
 from pybb.read_tracking import update_read_tracking
-from pybb.templatetags.pybb_tags import pybb_editable_by, pybb_moderated_by
+from pybb.permissions import is_moderator, is_subscribed, can_edit_post, \
+                             can_delete_post, get_profile, is_banned, \
+                             request_user
+from pybb.conditional import conditional, index_state, forum_state, \
+                             topic_state
+from pybb.page_cache import cache_page, index_tags, forum_tags, topic_tags
+from pybb.search import search_posts, decode_cursor
+from pybb.attachments import serve as serve_attachment
+from pybb.thumbnails import get_thumbnail, serve_thumbnail
 
 
 
@@ -47,47 +59,57 @@ def load_last_post(objects):
         obj.last_post = posts.get(obj.last_post_id)
 
 
+def count_topic_view(request, topic_id):
+    # do not use save() to not invalidate caches which depend on topics
+    Topic.objects.filter(pk=topic_id).update(views=F('views') + 1)
+
+
+@conditional(index_state)
+@cache_page(index_tags)
 @render_to('pybb/index.html')
 def index(request):
     """
     Display list of categories and forums in each category.
     """
 
-    cats = list(Category.objects.all())
-    cat_map = dict((x.pk, x) for x in cats)
-    for cat in cats:
-        cat.cached_forums = []
-    forums = list(Forum.objects.all())
-    load_last_post(forums)
-    for forum in forums:
-        cat_map[forum.category_id].cached_forums.append(forum)
-    return {'cats': cats,
+    return {'cats': get_forum_tree(),
             }
 
 
+@conditional(index_state)
+@cache_page(index_tags)
 @render_to('pybb/category_details.html')
 def category_details(request, category_id):
-    category = get_object_or_404(Category, pk=category_id)
-    forums = category.forums.all()
-    load_last_post(forums)
-    category.cached_forums = forums
+    for category in get_forum_tree():
+        if category.pk == int(category_id):
+            break
+    else:
+        raise Http404()
 
     return {'category': category,
             }
 
 
+@conditional(forum_state)
+@cache_page(forum_tags)
 @render_to('pybb/forum_details.html')
 def forum_details(request, forum_id):
     forum = get_object_or_404(Forum, pk=forum_id)
-    topics = forum.topics.order_by('-sticky', '-updated').select_related()
-    page = paginate(topics, request, settings.PYBB_FORUM_PAGE_SIZE)
+    page = paginate_keyset(forum.topics.select_related(), request,
+                           settings.PYBB_FORUM_PAGE_SIZE,
+                           ['-sticky', '-updated', '-id'],
+                           count=forum.topic_count,
+                           depth=settings.PYBB_FORUM_PAGINATION_DEPTH)
     load_last_post(page.object_list)
+    load_mini_pagination(page.object_list)
 
     return {'forum': forum,
             'page': page,
             }
 
 
+@conditional(topic_state)
+@cache_page(topic_tags, hit_func=count_topic_view)
 @render_to('pybb/topic_details.html')
 def topic_details(request, topic_id):
     try:
@@ -95,11 +117,11 @@ def topic_details(request, topic_id):
     except Topic.DoesNotExist:
         raise Http404()
 
+    count_topic_view(request, topic.pk)
     topic.views += 1
-    topic.save()
 
     if request.user.is_authenticated():
-        update_read_tracking(topic, request.user)
+        update_read_tracking(topic, request_user(request))
 	
     if settings.PYBB_FREEZE_FIRST_POST:
         first_post = topic.head
@@ -108,14 +130,11 @@ def topic_details(request, topic_id):
 
     form = AddPostForm(topic=topic)
 
-    moderator = (request.user.is_superuser or
-                 request.user in topic.forum.moderators.all())
-    subscribed = (request.user.is_authenticated() and
-                  request.user in topic.subscribers.all())
-
-    posts = topic.posts.all()
+    moderator = is_moderator(request_user(request), topic.forum_id)
+    subscribed = is_subscribed(request_user(request), topic.pk)
 
-    page = paginate(posts, request, settings.PYBB_TOPIC_PAGE_SIZE)
+    page = paginate_positions(topic.posts.all(), request,
+                              settings.PYBB_TOPIC_PAGE_SIZE, topic.post_count)
 
     users = User.objects.filter(pk__in=
         set(x.user_id for x in page.object_list)).select_related("pybb_profile")
@@ -148,7 +167,7 @@ def post_add(request, forum_id, topic_id):
     elif topic_id:
         topic = get_object_or_404(Topic, pk=topic_id)
 
-    if (topic and topic.closed) or request.user.pybb_profile.is_banned():
+    if (topic and topic.closed) or is_banned(request_user(request)):
         return HttpResponseRedirect(topic.get_absolute_url())
 
     try:
@@ -158,11 +177,11 @@ def post_add(request, forum_id, topic_id):
     else:
         post = get_object_or_404(Post, pk=quote_id)
         quote = quote_text(post.body_text,
-                           request.user.pybb_profile.markup,
+                           get_profile(request_user(request)).markup,
                            post.user.username)
 
     ip = request.META.get('REMOTE_ADDR', '')
-    form_kwargs = dict(topic=topic, forum=forum, user=request.user,
+    form_kwargs = dict(topic=topic, forum=forum, user=request_user(request),
                        ip=ip, initial={'body': quote})
     if request.method == 'POST':
         form = AddPostForm(request.POST, request.FILES, **form_kwargs)
@@ -194,6 +213,7 @@ def user_details_topics(request, username):
     user = get_object_or_404(User, username=username)
     topics = Topic.objects.filter(user=user).order_by('-created')
     page = paginate(topics, request, settings.PYBB_TOPIC_PAGE_SIZE)
+    load_mini_pagination(page.object_list)
 
     return {'profile': user,
             'page': page,
@@ -202,9 +222,8 @@ def user_details_topics(request, username):
 
 def post_details(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
-    count = post.topic.posts.filter(created__lt=post.created).count() + 1
-    page = math.ceil(count / float(settings.PYBB_TOPIC_PAGE_SIZE))
-    url = '%s?page=%d#post-%d' % (reverse('pybb_topic_details', args=[post.topic.id]), page, post.id)
+    page = math.ceil(post.position / float(settings.PYBB_TOPIC_PAGE_SIZE))
+    url = '%s?page=%d#post-%d' % (reverse('pybb_topic_details', args=[post.topic_id]), page, post.id)
     return redirect(url)
 
 
@@ -212,7 +231,7 @@ def post_details(request, post_id):
 @render_to('pybb/profile_edit.html')
 def profile_edit(request):
 
-    form_kwargs = dict(instance=request.user.pybb_profile)
+    form_kwargs = dict(instance=get_profile(request_user(request)))
     if request.method == 'POST':
         form = EditProfileForm(request.POST, request.FILES, **form_kwargs)
     else:
@@ -224,7 +243,7 @@ def profile_edit(request):
         return redirect('pybb_profile_edit')
 
     return {'form': form,
-            'profile': request.user.pybb_profile,
+            'profile': get_profile(request_user(request)),
             }
 
 
@@ -234,8 +253,8 @@ def post_edit(request, post_id):
 
     post = get_object_or_404(Post, pk=post_id)
 
-    if not pybb_editable_by(post, request.user) \
-    or request.user.pybb_profile.is_banned():
+    if not can_edit_post(request_user(request), post) \
+    or is_banned(request_user(request)):
         return redirect(post)
 
     head_post_id = post.topic.posts.order_by('created')[0].id
@@ -264,7 +283,7 @@ def post_edit(request, post_id):
 def topic_stick(request, topic_id):
 
     topic = get_object_or_404(Topic, pk=topic_id)
-    if pybb_moderated_by(topic, request.user):
+    if is_moderator(request_user(request), topic.forum_id):
         if not topic.sticky:
             topic.sticky = True
             topic.save()
@@ -274,7 +293,7 @@ def topic_stick(request, topic_id):
 @login_required
 def topic_unstick(request, topic_id):
     topic = get_object_or_404(Topic, pk=topic_id)
-    if pybb_moderated_by(topic, request.user):
+    if is_moderator(request_user(request), topic.forum_id):
         if topic.sticky:
             topic.sticky = False
             topic.save()
@@ -285,15 +304,8 @@ def topic_unstick(request, topic_id):
 @render_to('pybb/post_delete.html')
 def post_delete(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
-    last_post = post.topic.posts.order_by('-created')[0]
-
-    allowed = False
-    if request.user.is_superuser or\
-        request.user in post.topic.forum.moderators.all() or \
-        (post.user == request.user and post == last_post):
-        allowed = True
 
-    if not allowed:
+    if not can_delete_post(request_user(request), post):
         return redirect(post)
 
     if 'POST' == request.method:
@@ -315,7 +327,7 @@ def post_delete(request, post_id):
 @login_required
 def topic_close(request, topic_id):
     topic = get_object_or_404(Topic, pk=topic_id)
-    if pybb_moderated_by(topic, request.user):
+    if is_moderator(request_user(request), topic.forum_id):
         if not topic.closed:
             topic.closed = True
             topic.save()
@@ -326,7 +338,7 @@ def topic_close(request, topic_id):
 @login_required
 def topic_open(request, topic_id):
     topic = get_object_or_404(Topic, pk=topic_id)
-    if pybb_moderated_by(topic, request.user):
+    if is_moderator(request_user(request), topic.forum_id):
         if topic.closed:
             topic.closed = False
             topic.save()
@@ -341,7 +353,7 @@ def topic_merge(request):
     topics = get_list_or_404(Topic, pk__in=topics_ids)
 
     for topic in topics:
-        if not pybb_moderated_by(topic, request.user):
+        if not is_moderator(request_user(request), topic.forum_id):
             # TODO: show error message: no permitions for edit this topic
             return HttpResponseRedirect(topic.get_absolute_url())
 
@@ -362,6 +374,7 @@ def topic_merge(request):
                 post.save()
 
         main_topic.update_post_count()
+        main_topic.update_post_positions()
         main_topic.forum.update_post_count()
 
         for topic in topics:
@@ -380,21 +393,59 @@ def topic_merge(request):
 
 @render_to('pybb/user_list.html')
 def user_list(request):
-    users = User.objects.order_by('username')
     form = UserSearchForm(request.GET)
-    users = form.filter(users)
+    if form.is_valid() and form.cleaned_data['query']:
+        users = form.filter(User.objects.all())
+        count = None
+    else:
+        users = User.objects.all()
+        count = get_or_set('users', 'count', User.objects.count)
 
-    page = paginate(users, request, settings.PYBB_USERS_PAGE_SIZE)
+    page = paginate_keyset(users, request, settings.PYBB_USERS_PAGE_SIZE,
+                           ['username'], count=count,
+                           depth=settings.PYBB_FORUM_PAGINATION_DEPTH)
 
     return {'page': page,
             'form': form,
             }
 
 
+@render_to('pybb/search.html')
+def search(request):
+    if not settings.PYBB_SEARCH_ENABLE:
+        raise Http404()
+
+    form = SearchForm(request.GET or None)
+    posts = []
+    next_url = None
+    if form.is_valid():
+        try:
+            after = request.GET.get('after') and \
+                    decode_cursor(request.GET['after']) or None
+        except ValueError:
+            raise Http404()
+        forum = form.cleaned_data['forum']
+        author = form.cleaned_data['author']
+        posts, cursor = search_posts(form.cleaned_data['query'],
+                                     settings.PYBB_SEARCH_PAGE_SIZE,
+                                     forum=forum and forum.pk,
+                                     user=author and author.pk,
+                                     after=after)
+        if cursor:
+            next_url = page_qs(request.META.get('QUERY_STRING', ''),
+                               'after', cursor)
+
+    return {'form': form,
+            'posts': posts,
+            'next_url': next_url,
+            }
+
+
 @login_required
 def subscription_delete(request, topic_id):
     topic = get_object_or_404(Topic, pk=topic_id)
     topic.subscribers.remove(request.user)
+    SubscriptionState.objects.filter(topic=topic, user=request.user).delete()
     if 'from_topic' in request.GET:
         return redirect(topic)
     else:
@@ -411,16 +462,29 @@ def subscription_add(request, topic_id):
 @login_required
 def attachment_details(request, hash):
     attachment = get_object_or_404(Attachment, hash=hash)
-    file_obj = file(attachment.get_absolute_path())
-    # without it mod_python chokes with error that content_type must be string
-    return HttpResponse(file_obj, content_type=str(attachment.content_type))
+    return serve_attachment(request, attachment)
+
+
+@login_required
+def attachment_thumbnail(request, hash, size):
+    attachment = get_object_or_404(Attachment, hash=hash)
+    if size not in settings.PYBB_THUMBNAIL_SIZES:
+        raise Http404()
+    try:
+        path = get_thumbnail(attachment, size)
+    except Exception:
+        # PIL raises not only IOError on broken images
+        path = None
+    if path is None:
+        return redirect(attachment)
+    return serve_thumbnail(request, path)
 
 
 @login_required
 @ajax
 def post_ajax_preview(request):
     content = request.POST.get('content')
-    markup = request.user.pybb_profile.markup
+    markup = get_profile(request_user(request)).markup
 
     if not markup in dict(MARKUP_CHOICES).keys():
         return {'error': 'Invalid markup'}